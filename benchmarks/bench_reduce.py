@@ -0,0 +1,183 @@
+"""
+bench_reduce.py
+---------
+Benchmark for armament._reduce_matches_by_friendly.
+
+Purpose:
+- Keep the original groupby(...).apply implementation as a reference.
+- Check that the vectorized reduction returns the same rows and values on synthetic
+  armament results.
+- Time both at 1, 10 and 1000 friendlies.
+
+Kept outside dbc_app so it does not ship in the service image.
+
+Usage:
+    python benchmarks/bench_reduce.py [repeats]
+"""
+
+import json
+import os
+import random
+import sys
+import time
+import warnings
+from typing import Dict
+import pandas as pd
+
+# dbc_app modules import each other flat, so put the package directory on the path
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "dbc_app"))
+
+import armament
+
+warnings.filterwarnings("ignore")
+
+COLUMNS = [
+    "friendly_id", "weapon", "weapon_base_code", "qty",
+    "effectiveness", "range", "alt_low", "alt_high", "speed", "dependencies",
+    "total_effectiveness_percent", "qty_needed_for_90", "needs_more_note", "note",
+    "combined_total_effectiveness_percent", "qty_used", "ea_deliverables", "comm_deliverables", "sens_deliverables"
+]
+WEAPONS = ["AIM-120C", "AIM-9X", "AGM-88", "GBU-12", "GBU-31", "AGM-154", "AIM-7M", "GBU-38"]
+
+
+def reduce_groupby(df: pd.DataFrame) -> pd.DataFrame:
+    """The groupby(...).apply reduction armament.py used before it was vectorized."""
+    if df is None or df.empty:
+        return df
+
+    out = df.copy()
+    out["total_effectiveness_percent"] = pd.to_numeric(out["total_effectiveness_percent"], errors="coerce")
+    out["qty_needed_for_90"]          = pd.to_numeric(out["qty_needed_for_90"], errors="coerce")
+    out["effectiveness"]              = pd.to_numeric(out["effectiveness"], errors="coerce")
+    out["qty"]                        = pd.to_numeric(out["qty"], errors="coerce")
+
+    cols = out.columns.tolist()
+    for extra in ["combined_total_effectiveness_percent", "qty_used"]:
+        if extra not in cols:
+            cols.append(extra)
+
+    def choose(group: pd.DataFrame) -> pd.DataFrame:
+        matches = group[~group["weapon"].isna()]
+        if matches.empty:
+            return group.iloc[[0]]
+
+        ge90 = matches[matches["total_effectiveness_percent"] >= 90.0]
+        if not ge90.empty:
+            return ge90.sort_values(
+                by=["qty_needed_for_90", "total_effectiveness_percent"],
+                ascending=[True, False]
+            ).iloc[[0]]
+
+        valid = matches[(matches["effectiveness"].notna()) & (matches["qty"].notna()) & (matches["qty"] >= 1)]
+        if valid.empty:
+            return matches
+
+        # Only change from the original: a stable sort. The default quicksort left the order
+        # of equally effective weapons to numpy; the vectorized version keeps row order.
+        valid = valid.assign(
+            p = valid["effectiveness"].astype(float) / 100.0,
+            q = valid["qty"].astype(int)
+        ).sort_values("p", ascending=False, kind="stable")
+
+        failure = 1.0
+        plan_counts: Dict[str, int] = {}
+        for _, r in valid.iterrows():
+            p = float(r["p"])
+            q = int(r["q"])
+            name = str(r["weapon"])
+
+            used = 0
+            for _ in range(q):
+                if 1.0 - failure >= 0.90:
+                    break
+                failure *= (1.0 - p)
+                used += 1
+
+            if used > 0:
+                plan_counts[name] = used
+            if 1.0 - failure >= 0.90:
+                break
+
+        combined_pct = round((1.0 - failure) * 100.0, 2)
+
+        labeled = matches.copy()
+        used_mask = labeled["weapon"].astype(str).isin(plan_counts.keys())
+        labeled.loc[used_mask, "note"] = "COMBINED PLAN"
+        labeled.loc[used_mask, "combined_total_effectiveness_percent"] = combined_pct
+        labeled["qty_used"] = pd.NA
+        for wname, cnt in plan_counts.items():
+            labeled.loc[labeled["weapon"].astype(str) == wname, "qty_used"] = cnt
+        labeled.loc[~used_mask, "combined_total_effectiveness_percent"] = pd.NA
+        return labeled
+
+    reduced = (
+        out.groupby(["friendly_id"], dropna=False, group_keys=False)
+           .apply(choose)
+           .reset_index(drop=True)
+    )
+    return reduced[cols]
+
+
+def _note_row(fid, note):
+    row = dict.fromkeys(COLUMNS)
+    row.update(friendly_id=fid, note=note)
+    return row
+
+
+def _weapon_row(rng: random.Random, fid):
+    qty = rng.choice([1, 2, 2, 4, 6, 0, 2.0, None])
+    eff = rng.choice([round(rng.uniform(5, 95), 2), 10, 25, 33.33, 50, None, "n/a"])
+    row = dict.fromkeys(COLUMNS)
+    row.update(friendly_id=fid, weapon=rng.choice(WEAPONS), qty=qty, effectiveness=eff)
+    if armament._val_present(eff) and isinstance(qty, (int, float)):
+        total, needed, more = armament.qty_to_reach_threshold(eff, qty)
+        row.update(total_effectiveness_percent=total, qty_needed_for_90=needed, needs_more_note=more or None)
+    return row
+
+
+def make_results(n_friendlies: int, seed: int = 0) -> pd.DataFrame:
+    """Rows shaped like check_armaments builds them, covering every reduction branch."""
+    rng = random.Random(seed)
+    rows = []
+    for i in range(n_friendlies):
+        fid = rng.choice([f"VIPER{i:04d}", None]) if rng.random() < 0.05 else f"VIPER{i:04d}"
+        kind = rng.random()
+        if kind < 0.15:
+            rows.append(_note_row(fid, "No parseable weapons provided."))
+        else:
+            rows.extend(_weapon_row(rng, fid) for _ in range(rng.randint(1, 5)))
+        if kind > 0.95:
+            rows.append(_note_row(fid, "The asset has no armaments that meet the criteria of this engagement."))
+    return pd.DataFrame(rows, columns=COLUMNS)
+
+
+def _payload(df: pd.DataFrame) -> str:
+    """The JSON check_armaments would emit for these rows."""
+    return json.dumps(df.where(pd.notnull(df), None).to_dict("records"))
+
+
+def _best_of(fn, df, repeats: int) -> float:
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main(repeats: int = 5):
+    for seed in range(200):
+        df = make_results(random.Random(seed).randint(1, 40), seed)
+        assert _payload(reduce_groupby(df)) == _payload(armament._reduce_matches_by_friendly(df)), seed
+
+    print(f"{'friendlies':>10} {'rows':>6} {'groupby (ms)':>13} {'vectorized (ms)':>16} {'speedup':>8}")
+    for n in (1, 10, 1000):
+        df = make_results(n, seed=n)
+        assert _payload(reduce_groupby(df)) == _payload(armament._reduce_matches_by_friendly(df))
+        old = _best_of(reduce_groupby, df, repeats)
+        new = _best_of(armament._reduce_matches_by_friendly, df, repeats)
+        print(f"{n:>10} {len(df):>6} {old * 1000:>13.2f} {new * 1000:>16.2f} {old / new:>7.1f}x")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
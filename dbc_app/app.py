@@ -22,14 +22,33 @@ import hostiles
 import fuel
 import time_to_target 
 import support 
+import snapshot
 import database
 import json
 import warnings
 import re
 import user_input
-import time
+import track_parser
+import listener
+import instrumentation
+import metrics
+import os
+import traceback
+from concurrent.futures import ThreadPoolExecutor
 warnings.filterwarnings("ignore")
 
+# Friendlies of one MEF evaluated concurrently; 1 = one after another
+EVAL_WORKERS = int(os.getenv("DBC_EVAL_WORKERS", "4"))
+
+def write_coas(rows):
+    """database.push_coa_many, counting the COAs that were actually written."""
+    written = database.push_coa_many(rows)
+    metrics.coa_produced(written)
+    return written
+
+# Queue mode batches COA writes (DB_BULK_FLUSH_SIZE rows / DB_BULK_FLUSH_INTERVAL seconds)
+coa_writer = database.BulkWriter(write_coas) if database.QUEUE_MODE else None
+
 # === Main Workflow ===
 global temp 
 temp = None
@@ -38,10 +57,11 @@ def get_friendly_aircraft():
     return 0
 
 
-def evaluate_aircraft(friendly, target, message, timestamp):
+def evaluate_aircraft(friendly, target, message, timestamp, world=None):
     """
     Given a single friendly aircraft and a target aircraft,
     run through all evaluation modules and return results.
+    `world` is the cycle's snapshot.WorldSnapshot; every module reads from it when given.
     """
     results = {}
 
@@ -50,100 +70,120 @@ def evaluate_aircraft(friendly, target, message, timestamp):
 
     # 1. Weapon Viability
     # values - 4 valid weapon pair, 3 asset weapon not 90% effective, 2 asset weapon no options, 1 missing asset or target domain
-    results_amament = armament.check_armaments(friendly, target)
+    with instrumentation.stage("armament"):
+        results_amament = armament.check_armaments(friendly, target, world)
     #print(f'armament: {results_amament}')
 
     # 2. Hostile Threat Evaluation
     # values - 4 = no hostiles, 3 and below = yes hostiles [details follow]
-    results_hostiles = hostiles.evaluate_threat(friendly, target)
+    with instrumentation.stage("hostiles"):
+        results_hostiles = hostiles.evaluate_threat(friendly, target, world)
     #print(f'hostiles: {results_hostiles}')
 
     # 3. Fuel Analysis
     # values - 3 = no refuel needed, 2 = refuel needed [details follow], 1 = undetermined [details follow]
-    results_fuel = fuel.analyze_fuel(friendly, target)
+    with instrumentation.stage("fuel"):
+        results_fuel = fuel.analyze_fuel(friendly, target, world)
     # print(f'fueld: {results_fuel}')
 
     # 4. Time Analysis
     # values - in minutes
-    results_time = time_to_target.compute_time(friendly, target)
+    with instrumentation.stage("time"):
+        results_time = time_to_target.compute_time(friendly, target, world)
     # print(f'time: {results_time}')
 
     # 5. Supporting Assets 
-    results_support = support.gather_support(friendly, target, results_hostiles)
+    with instrumentation.stage("support"):
+        results_support = support.gather_support(friendly, target, results_hostiles, world)
     # results_support = None
     #print(f'support: {results_support}')
 
     #6. Generate sequence 
-    results_sequence = sequence.make_timeline(friendly, results_hostiles, results_fuel, results_support, timestamp)
+    with instrumentation.stage("sequence"):
+        results_sequence = sequence.make_timeline(friendly, results_hostiles, results_fuel, results_support, timestamp)
 
     #7. Assess risk and Build 5-Line
-    results = fiveline.generate(results_amament, results_hostiles, results_fuel, results_time, results_support, results_sequence, message, friendly, target)
+    with instrumentation.stage("fiveline"):
+        results = fiveline.generate(results_amament, results_hostiles, results_fuel, results_time, results_support, results_sequence, message, friendly, target)
     print(results)
     print("WORKS")
 
     return results
 
 
-def main():
+def evaluate_friendlies(friendly_aircraft_list, target, message, timestamp, world=None, workers=EVAL_WORKERS):
     """
-    Main execution logic:
-    - Pull friendly aircraft (3 total) and 1 hostile target from the database.
-    - Iterate each friendly through evaluation pipeline.
-    - Print or log final summary for all aircraft.
+    Run evaluate_aircraft for every friendly of one MEF, on a thread pool when workers > 1.
+    Results come back in the MEF's order; a friendly whose evaluation raises is reported
+    with its traceback and returned as None so it cannot abort the others.
     """
-    # Step 1: Get Data
-    global temp 
-    #print(f"old: {temp}")
-    user_input.insert_input()
-    current_MEF = database.query_mef()  
-    #print(f"new: {current_MEF}")
-    if temp is not None:
-        print(f"temp {type(temp)} MEF {type(current_MEF)}")
-        if temp.equals(current_MEF):
-            print("MEF already processed")
-            return 
-    else:
-        print("New MEF")
+    def evaluate_one(idx, friendly):
+        try:
+            return evaluate_aircraft(friendly, target, message, timestamp, world)
+        except Exception as e:
+            print(f"Aircraft_{idx} evaluation failed, possibly non-exist target or asset: {e}")
+            traceback.print_exc()
+            metrics.friendly_failed()
+            return None
 
-    temp = current_MEF
-    # return
-    friendly_aircraft_list = current_MEF["actions"].iloc[0]  # Expect list of 3 aircraft
+    indices = range(1, len(friendly_aircraft_list) + 1)
+    if workers <= 1 or len(friendly_aircraft_list) <= 1:
+        return [evaluate_one(idx, friendly) for idx, friendly in zip(indices, friendly_aircraft_list)]
+
+    with ThreadPoolExecutor(max_workers=min(workers, len(friendly_aircraft_list))) as pool:
+        # map() yields in submission order, so the COA order matches the MEF
+        return list(pool.map(evaluate_one, indices, friendly_aircraft_list))
+
+
+def process_mef(mef, world=None, writer=None):
+    """
+    Evaluate one MEF row (entity, actions, message, timestamp) and push its COA.
+    `world` is the cycle's snapshot.WorldSnapshot; with a database.BulkWriter the COA is
+    buffered for a batched write instead of being inserted on its own.
+    Returns False, without writing anything, when every friendly evaluation failed.
+    """
+    friendly_aircraft_list = mef["actions"]  # Expect list of 3 aircraft
     # friendly_aircraft_list = json.loads(friendly_aircraft_list)
     # print(type(friendly_aircraft_list))
     # print(friendly_aircraft_list[0].keys())
     
-    target_aircraft = current_MEF["entity"].iloc[0]  # Expect single hostile aircraft
-    target_message = current_MEF["message"].iloc[0]
-    target_time = current_MEF["timestamp"].iloc[0]
+    target_aircraft = mef["entity"]  # Expect single hostile aircraft
+    target_message = mef["message"]
+    target_time = mef["timestamp"]
 
     #print(f"tar air: {target_aircraft}")
     # extract tracknumber
-    match = re.match(r'\s*(\d{5})', target_aircraft)
-    if match:
-        target_aircraft_id = match.group(1)
+    target_track = track_parser.parse_target(target_aircraft)
+    if target_track is not None and len(target_track.track_id) >= 5:
+        target_aircraft_id = target_track.track_id[:5]
     else:
-        target_aircraft_id = None
+        match = re.match(r'\s*(\d{5})', target_aircraft)
+        target_aircraft_id = match.group(1) if match else None
 
     #print(f"tar air id: {target_aircraft_id}")
     #print(f"tar air: {target_aircraft}")
     # Step 2: Run evaluations
     all_results = {}
     coa = []
-    for idx, friendly in enumerate(friendly_aircraft_list, start=1):
-        #print(f"\n=== Evaluating Friendly Aircraft {idx} ===")
-        #try:
-        evaluation = evaluate_aircraft(friendly, target_aircraft, target_message, target_time)
+    evaluations = evaluate_friendlies(friendly_aircraft_list, target_aircraft, target_message, target_time, world)
+    for idx, evaluation in enumerate(evaluations, start=1):
+        if evaluation is None:
+            continue
         all_results[f"Aircraft_{idx}"] = evaluation
         coa.append(evaluation)
-        #except:
-        #    print("Possibly non-exist target or asset")
 
     print(coa)
+    if not coa:
+        print(f"No COA for target {target_aircraft_id}: every friendly evaluation failed")
+        return False
     # Insert into DB
     # return
-    database.push_coa_to_db(target_aircraft_id, coa, target_message, target_time)
+    if writer is not None:
+        writer.add((target_aircraft_id, coa, target_message, target_time))  # counted when flushed
+    elif database.push_coa_to_db(target_aircraft_id, coa, target_message, target_time):
+        metrics.coa_produced()
 
-    return
+    return True
     # Step 3: Summarize results
     print("\n===== Final Summary =====")
     for ac_name, eval_data in all_results.items():
@@ -154,10 +194,67 @@ def main():
     # TODO: Later we could write results to file, or pass to a reporting module
 
 
+def process_pending(world=None):
+    """
+    Queue mode: claim up to BATCH_MAX_SIZE unprocessed MEF rows and evaluate each of them
+    against the same snapshot. Returns the number of MEFs claimed.
+    """
+    batch = database.claim_mef(database.BATCH_MAX_SIZE)
+    for _, mef in batch.iterrows():
+        try:
+            process_mef(mef, world, coa_writer)
+        except Exception as e:
+            print(f"MEF {mef.get('entity')} evaluation failed: {e}")
+    return len(batch)
+
+
+def main():
+    """
+    Main execution logic:
+    - Pull friendly aircraft (3 total) and 1 hostile target from the database.
+    - Iterate each friendly through evaluation pipeline.
+    - Print or log final summary for all aircraft.
+    Returns True when a new MEF was evaluated, False when there was nothing new.
+    """
+    # Step 1: Get Data
+    global temp 
+    #print(f"old: {temp}")
+    with instrumentation.stage("snapshot"):
+        world = snapshot.load()  # one read of the track picture per cycle
+    if world is None:
+        return False  # track views unreadable; try again next cycle
+    with instrumentation.stage("user_input"):
+        user_input.insert_input(world)
+    if database.QUEUE_MODE:
+        return process_pending(world) > 0
+
+    current_MEF = database.query_mef()  
+    #print(f"new: {current_MEF}")
+    if temp is not None:
+        print(f"temp {type(temp)} MEF {type(current_MEF)}")
+        if temp.equals(current_MEF):
+            print("MEF already processed")
+            return False
+    else:
+        print("New MEF")
+
+    temp = current_MEF
+    # return
+    return process_mef(current_MEF.iloc[0], world)
+
+
 if __name__ == "__main__":
+    # Sleeps until NOTIFY reports new user_input/MEF rows; polls with backoff if it can't
+    waiter = listener.WorkWaiter()
+    metrics.start()  # /metrics and /healthz on DBC_METRICS_PORT (8070)
+    # Warm the red catalog cache in one parallel round before the first cycle
+    database.prefetch_all()
     while(True):
         print("***********START******************")
-        main()
+        did_work = instrumentation.run_cycle(main)  # timed; profiled once with DBC_PROFILE=1
+        metrics.cycle_finished(did_work)
         # break
-        time.sleep(1)
         print("***********END*********************")
+        if did_work and database.QUEUE_MODE:
+            continue  # drain the queue before sleeping
+        waiter.wait(did_work)
@@ -1,10 +1,13 @@
 from __future__ import annotations
 import re
 import json
-from typing import Iterable, Dict, Any, List, Tuple, Optional
+from typing import Iterable, Dict, Any, List, Sequence, Tuple, Optional
+import numpy as np
 import pandas as pd
 
 import database  
+import probability
+import track_parser
 
 
 # ----------------------------- Classifiers -----------------------------
@@ -28,6 +31,9 @@ _ENEMY_TRACKCAT_RE = re.compile(r"(?i)\btrack\s*cat\s*:\s*([A-Za-z]+)")
 
 def classify_enemy_side_from_text(enemy_str: str) -> Optional[str]:
     """Supports string inputs like '(... Track Cat: Surface ...)'."""
+    track = track_parser.parse_target(enemy_str)
+    if track is not None and track.track_cat:
+        return classify_side_from_trackcat(track.track_cat)
     m = _ENEMY_TRACKCAT_RE.search(enemy_str or "")
     return classify_side_from_trackcat(m.group(1) if m else None)
 
@@ -62,6 +68,28 @@ def classify_enemy_side(enemy_data: Any) -> Optional[str]:
         return classify_enemy_side_from_text(enemy_data)
     return None
 
+_ENEMY_TN_RE = re.compile(r"^\s*(\d+)")
+
+def _enemy_tracknumber(enemy_data: Any) -> Optional[str]:
+    """Track number from '44875 (...)' strings or an {'id': ...} dict."""
+    if isinstance(enemy_data, dict):
+        tn = enemy_data.get("id")
+        return str(tn) if tn is not None else None
+    if isinstance(enemy_data, str):
+        track = track_parser.parse_target(enemy_data)
+        if track is not None:
+            return track.track_id
+        m = _ENEMY_TN_RE.match(enemy_data)
+        return m.group(1) if m else None
+    return None
+
+def classify_enemy_side_from_snapshot(enemy_data: Any, snapshot: Any) -> Optional[str]:
+    """Fallback: use the live track's category from the cycle snapshot."""
+    if snapshot is None:
+        return None
+    tn = _enemy_tracknumber(enemy_data)
+    return classify_side_from_trackcat(snapshot.trackcategory(tn)) if tn else None
+
 def classify_friendly_side(asset: Dict[str, Any]) -> Optional[str]:
     # Prefer explicit trackcategory
     t = asset.get("trackcategory")
@@ -126,26 +154,28 @@ def _ensure_friendly_list(friendly_assets: Any) -> List[Dict[str, Any]]:
 
 
 # ----------------------------- Deliverables query routing -----------------------------
-# (friendly_side, enemy_side)
+# (friendly_side, enemy_side) -> database.RED_CATALOG key
 _QUERY_MAP = {
-    ("air", "air"):        database.query_red_air_del_a2a,
-    ("air", "land"):       database.query_red_ground_del_a2s,
-    ("air", "surface"):    database.query_red_maritime_del_a2s,  # air→surface (maritime)
-    ("surface", "air"):    database.query_red_air_del_s2a,       # surface→air
-    ("land", "surface"):   database.query_red_maritime_del_s2s,  # per your rule
-    ("ground", "surface"): database.query_red_maritime_del_s2s,  # alias
-    ("surface", "surface"): database.query_red_maritime_del_s2s,
+    ("air", "air"):        ("air", "del", "a2a"),
+    ("air", "land"):       ("ground", "del", "a2s"),
+    ("air", "surface"):    ("maritime", "del", "a2s"),  # air→surface (maritime)
+    ("surface", "air"):    ("air", "del", "s2a"),       # surface→air
+    ("land", "surface"):   ("maritime", "del", "s2s"),  # per your rule
+    ("ground", "surface"): ("maritime", "del", "s2s"),  # alias
+    ("surface", "surface"): ("maritime", "del", "s2s"),
 }
 
-def fetch_deliverables_df(friendly_side: str, enemy_side: str) -> pd.DataFrame:
-    key = (friendly_side, enemy_side)
-    func = _QUERY_MAP.get(key)
-    if not func:
+def _query_for(friendly_side: str, enemy_side: str):
+    key = _QUERY_MAP.get((friendly_side, enemy_side))
+    if not key:
         raise ValueError(
             f"No deliverables mapping for friendly='{friendly_side}' vs enemy='{enemy_side}'. "
             f"Known keys: {list(_QUERY_MAP.keys())}"
         )
-    df = func()
+    return key
+
+def fetch_deliverables_df(friendly_side: str, enemy_side: str) -> pd.DataFrame:
+    df = database.fetch_catalog(*_query_for(friendly_side, enemy_side))
     return _ensure_base_codes(_ensure_string_deliverable_col(df))
 
 # ----------------------------- Weapon parsing -----------------------------
@@ -239,35 +269,94 @@ def _pick_col(df: pd.DataFrame, names: Iterable[str]) -> Optional[str]:
     return None
 
 
-# ----------------------------- Matching -----------------------------
-def _match_single_weapon(weap: Dict[str, Any], cat_df: pd.DataFrame) -> Optional[pd.Series]:
-    """Match by base code first; fallback to substring."""
-    if cat_df is None or cat_df.empty:
+# ----------------------------- Compiled catalog -----------------------------
+class DeliverablesCatalog:
+    """
+    A deliverables DataFrame compiled for weapon matching:
+      - base_index: base_code -> position of the first row whose base_codes contain it (O(1) exact match)
+      - names_norm: deliverable_raw normalized once per row (None for non-strings)
+    Substring fallbacks are memoized per normalized weapon name.
+    """
+
+    def __init__(self, df: pd.DataFrame):
+        self.df = df
+        self.base_index: Dict[str, int] = {}
+        self.names_norm: List[Optional[str]] = []
+        self._substring_hits: Dict[str, Optional[int]] = {}
+        if df is None or df.empty:
+            return
+        for pos, codes in enumerate(df["base_codes"]):
+            if isinstance(codes, set):
+                for code in codes:
+                    self.base_index.setdefault(code, pos)
+        self.names_norm = [_normalize_name(t) if isinstance(t, str) else None for t in df["deliverable_raw"]]
+
+    @property
+    def empty(self) -> bool:
+        return self.df is None or self.df.empty
+
+    def _first_substring(self, nameN: str) -> Optional[int]:
+        if nameN not in self._substring_hits:
+            self._substring_hits[nameN] = next(
+                (pos for pos, txt in enumerate(self.names_norm) if txt is not None and nameN in txt), None
+            )
+        return self._substring_hits[nameN]
+
+    def match(self, weap: Dict[str, Any]) -> Optional[pd.Series]:
+        """First row by base code; fallback to the first row containing the normalized name."""
+        if self.empty:
+            return None
+
+        base = weap.get("base_code")
+        if base:
+            pos = self.base_index.get(base)
+            if pos is not None:
+                return self.df.iloc[pos]
+
+        nameN = weap.get("name_norm") or ""
+        if len(nameN) >= 3:
+            pos = self._first_substring(nameN)
+            if pos is not None:
+                return self.df.iloc[pos]
+
         return None
 
-    base = weap.get("base_code")
-    if base:
-        hits = cat_df[cat_df["base_codes"].apply(lambda s: base in s if isinstance(s, set) else False)]
-        if not hits.empty:
-            return hits.iloc[0]
 
-    nameN = weap.get("name_norm") or ""
-    if len(nameN) >= 3:
-        def _has_sub(txt: Any) -> bool:
-            return isinstance(txt, str) and (nameN in _normalize_name(txt))
-        hits = cat_df[cat_df["deliverable_raw"].apply(_has_sub)]
-        if not hits.empty:
-            return hits.iloc[0]
+# (friendly_side, enemy_side) -> (raw table frame it was compiled from, catalog)
+_COMPILED: Dict[Tuple[str, str], Tuple[pd.DataFrame, DeliverablesCatalog]] = {}
 
-    return None
+def fetch_catalog(friendly_side: str, enemy_side: str) -> DeliverablesCatalog:
+    """
+    Compiled catalog for a side pairing. database caches the red tables, so while the
+    cached frame is unchanged the compiled catalog (base codes included) is reused too.
+    """
+    key = (friendly_side, enemy_side)
+    raw = database.fetch_catalog(*_query_for(friendly_side, enemy_side))
+    compiled = _COMPILED.get(key)
+    if compiled is not None and compiled[0] is raw:
+        return compiled[1]
+    catalog = DeliverablesCatalog(_ensure_base_codes(_ensure_string_deliverable_col(raw)))
+    if raw is not None and not raw.empty:
+        _COMPILED[key] = (raw, catalog)
+    return catalog
+
+
+# ----------------------------- Matching -----------------------------
+def _match_single_weapon(weap: Dict[str, Any], cat: Any) -> Optional[pd.Series]:
+    """Match by base code first; fallback to substring. Accepts a DeliverablesCatalog or a raw DataFrame."""
+    if cat is None:
+        return None
+    if not isinstance(cat, DeliverablesCatalog):
+        cat = DeliverablesCatalog(cat)
+    return cat.match(weap)
 
 
 
 # ----------------------------- Ammo Needed -----------------------------
 def qty_to_reach_threshold(eff_percent: Any, qty: Any, threshold: float = 0.9) -> Tuple[float, int, str]:
     """
-    Given per-try effectiveness in % (e.g., 33.33) and a max qty,
-    iterate n = 1..qty and stop when 1-(1-p)**n >= threshold or n == qty.
+    Given per-try effectiveness in % (e.g., 33.33) and a max qty, find the first
+    n in 1..qty with 1-(1-p)**n >= threshold (closed form, see probability.py).
     Returns: (cumulative_percent, qty_needed_for_threshold, need_more_note)
       - cumulative_percent: 0..100 with two decimals
       - qty_needed_for_90: n that first reaches >= threshold, else 0
@@ -281,13 +370,13 @@ def qty_to_reach_threshold(eff_percent: Any, qty: Any, threshold: float = 0.9) -
     if qmax <= 0 or p <= 0.0:
         return 0.0, 0, ""
 
-    last = 0.0
-    qty_needed = 0
-    for n in range(1, qmax + 1):
-        last = 1 - (1 - p) ** n
-        if last >= threshold:
-            qty_needed = n
-            break
+    n = max(probability.shots_to_threshold(p, threshold), 1)
+    if n <= qmax:
+        qty_needed = n
+        last = probability.cumulative(p, n)
+    else:
+        qty_needed = 0
+        last = probability.cumulative(p, qmax)
 
     need_more = ""
     if qty_needed == 0:
@@ -296,6 +385,34 @@ def qty_to_reach_threshold(eff_percent: Any, qty: Any, threshold: float = 0.9) -
     return round(last * 100, 2), qty_needed, need_more
 
 
+def _attach_qty_to_threshold(rows: List[Dict[str, Any]], threshold: float = 0.9) -> None:
+    """
+    qty_to_reach_threshold for every row with an effectiveness and a numeric qty, through
+    probability.qty_to_reach_threshold_np; fills total_effectiveness_percent,
+    qty_needed_for_90 and needs_more_note in place.
+    """
+    todo = [row for row in rows if _val_present(row.get("effectiveness")) and isinstance(row.get("qty"), (int, float))]
+    if not todo:
+        return
+
+    p: List[float] = []
+    qmax: List[int] = []
+    for row in todo:
+        try:
+            p.append(float(row["effectiveness"]) / 100.0)
+            qmax.append(int(row["qty"]))
+        except (TypeError, ValueError, OverflowError):
+            p.append(0.0)
+            qmax.append(0)
+
+    percents, needed = probability.qty_to_reach_threshold_np(p, qmax, threshold)
+    for row, prob, q, percent, n in zip(todo, p, qmax, percents, needed):
+        row["total_effectiveness_percent"] = float(percent)
+        row["qty_needed_for_90"] = int(n)
+        if n == 0 and q > 0 and prob > 0:
+            row["needs_more_note"] = f"More than {q} needed for >{int(threshold*100)}% effectiveness"
+
+
 # -----------------------------  Risk Assessment -----------------------------
 def _val_present(x: Any) -> bool:
     # truthy for non-empty strings/numbers and non-NaN values
@@ -340,6 +457,24 @@ def _val_present(x: Any) -> bool:
 
 
 # ----------------------------- Reduction (one result per friendly_id) -----------------------------
+def _combined_plan_shots(p: Sequence[float], q: Sequence[int]) -> Tuple[List[int], float]:
+    """
+    A combined plan fired one shot at a time, weapons in plan order: rounds used per weapon
+    and the miss probability left once the plan reaches 90% (or runs out of rounds).
+    """
+    failure = 1.0
+    used = [0] * len(p)
+    for i, (pi, qi) in enumerate(zip(p, q)):
+        for _ in range(int(qi)):
+            if 1.0 - failure >= 0.90:
+                break
+            failure *= (1.0 - float(pi))
+            used[i] += 1
+        if 1.0 - failure >= 0.90:
+            break
+    return used, failure
+
+
 def _reduce_matches_by_friendly(df: pd.DataFrame) -> pd.DataFrame:
     """
     For each friendly_id:
@@ -364,87 +499,119 @@ def _reduce_matches_by_friendly(df: pd.DataFrame) -> pd.DataFrame:
     out["qty"]                        = pd.to_numeric(out["qty"], errors="coerce")
 
     # Preserve original columns + new combined metrics
-    cols = out.columns.tolist()
     for extra in ["combined_total_effectiveness_percent", "qty_used"]:
-        if extra not in cols:
-            cols.append(extra)
-
-    def choose(group: pd.DataFrame) -> pd.DataFrame:
-        # Separate actual matches from pure note rows
-        matches = group[~group["weapon"].isna()]
-        if matches.empty:
-            # Only note rows -> keep one
-            return group.iloc[[0]]
-
-        # Case 1: keep a single best row if any individual match reaches >=90%
-        ge90 = matches[matches["total_effectiveness_percent"] >= 90.0]
-        if not ge90.empty:
-            best = ge90.sort_values(
-                by=["qty_needed_for_90", "total_effectiveness_percent"],
-                ascending=[True, False]
-            ).iloc[[0]]
-            return best
-
-        # Case 2: combined plan across weapons (keep multiple rows, label + attach combined metrics)
-        valid = matches[(matches["effectiveness"].notna()) & (matches["qty"].notna()) & (matches["qty"] >= 1)]
-        if valid.empty:
-            # Nothing to compute; return all matches unchanged
-            return matches
-
-        # Greedy: highest per-shot effectiveness first
-        valid = valid.assign(
-            p = valid["effectiveness"].astype(float) / 100.0,
-            q = valid["qty"].astype(int)
-        ).sort_values("p", ascending=False)
-
-        failure = 1.0
-        plan_counts: Dict[str, int] = {}
-        shots_used_total = 0
-
-        # Build plan by consuming shots from highest-p first
-        for _, r in valid.iterrows():
-            p = float(r["p"])
-            q = int(r["q"])
-            name = str(r["weapon"])
-
-            used = 0
-            for _ in range(q):
-                if 1.0 - failure >= 0.90:
-                    break
-                failure *= (1.0 - p)
-                used += 1
-                shots_used_total += 1
-
-            if used > 0:
-                plan_counts[name] = used
-
-            if 1.0 - failure >= 0.90:
-                break
+        if extra not in out.columns:
+            out[extra] = None
+    cols = out.columns.tolist()
 
-        combined_pct = round((1.0 - failure) * 100.0, 2)
+    # Group number per row, in groupby order (sorted friendly_id, missing ids last)
+    gid, uniques = pd.factorize(out["friendly_id"], sort=True)
+    gid = np.where(gid < 0, len(uniques), gid)
+    pos = np.arange(len(out))
+    n_groups = int(gid.max()) + 1
+
+    has_weapon = out["weapon"].notna().to_numpy()
+    tep = out["total_effectiveness_percent"].to_numpy(dtype=float)
+    ge90 = has_weapon & (tep >= 90.0)
+    group_has_weapon = np.bincount(gid, weights=has_weapon, minlength=n_groups) > 0
+    group_has_ge90 = np.bincount(gid, weights=ge90, minlength=n_groups) > 0
+
+    keep = np.zeros(len(out), dtype=bool)
+
+    # Only note rows -> keep the group's first row
+    _, first_pos = np.unique(gid, return_index=True)
+    keep[first_pos[~group_has_weapon]] = True
+
+    # Case 1: a single best row per group if any individual match reaches >=90%:
+    # lowest qty_needed_for_90 (missing last), then highest total_effectiveness_percent
+    best = np.flatnonzero(ge90)
+    needed = out["qty_needed_for_90"].to_numpy(dtype=float)[best]
+    best = best[np.lexsort((best, -tep[best], needed, gid[best]))]
+    _, first_best = np.unique(gid[best], return_index=True)
+    keep[best[first_best]] = True
+
+    # Case 2: keep every match, and build a combined plan where effectiveness and qty allow
+    combined = has_weapon & (group_has_weapon & ~group_has_ge90)[gid]
+    keep |= combined
+
+    eff = out["effectiveness"].to_numpy(dtype=float)
+    qty = out["qty"].to_numpy(dtype=float)
+    valid = np.flatnonzero(combined & ~np.isnan(eff) & ~np.isnan(qty) & (qty >= 1))
+    if valid.size:
+        # Greedy: highest per-shot effectiveness first (ties keep row order)
+        valid = valid[np.lexsort((valid, -eff[valid], gid[valid]))]
+        g = gid[valid]
+        p = eff[valid] / 100.0
+        q = qty[valid].astype(int)
+
+        # Miss probability each weapon leaves when all of its rounds are fired, and the
+        # running miss probability before each weapon within its friendly's plan
+        spent = (1.0 - np.minimum(p, 1.0)) ** q
+        failure_after = pd.Series(spent).groupby(g).cumprod().to_numpy()
+        failure_before = np.where(np.r_[True, g[1:] != g[:-1]], 1.0, np.r_[1.0, failure_after[:-1]])
+
+        # The plan stops at the first weapon that brings it to 90%: earlier weapons fire
+        # everything, that one only the rounds it needs, later ones nothing
+        reaches = 1.0 - failure_after >= 0.90
+        past_reach = (pd.Series(reaches).groupby(g).cumsum().to_numpy() - reaches) > 0
+        rounds = probability.shots_to_threshold_np(p, 0.90, failure_before)
+        used = np.where(past_reach, 0, np.where(reaches, np.minimum(rounds, q), q)).astype(int)
+        fired = ~past_reach
+        left = failure_before * (1.0 - p) ** used
+        failure = pd.Series(left[fired]).groupby(g[fired]).last()
+
+        # (1 - p)**q can differ in the last bits from multiplying shot by shot. Friendlies
+        # where that could tip the 90% check or the 2-decimal rounding are replayed one
+        # shot at a time, so every value matches the per-shot plan exactly.
+        slack = 8 * np.finfo(float).eps * (pd.Series(q).groupby(g).transform("sum").to_numpy() + len(q) + 1)
+        slack = slack * np.maximum(1.0, np.abs(failure_before))
+        before_last = failure_before * (1.0 - p) ** np.maximum(used - 1, 0)
+        near = fired & ((np.abs(left - 0.10) <= slack) | (reaches & (np.abs(before_last - 0.10) <= slack)))
+        group_slack = pd.Series(slack).groupby(g).max()
+        tenths = (1.0 - failure) * 1e4  # the rounded percentage's last digit sits at 1e-4
+        near_rounding = np.abs(tenths - np.floor(tenths) - 0.5) <= 1e4 * group_slack[failure.index]
+        replay = set(np.unique(g[near])) | set(failure.index[near_rounding.to_numpy()])
+        for grp in replay:
+            at = np.flatnonzero(g == grp)
+            used[at], failure[grp] = _combined_plan_shots(p[at], q[at])
+
+        # Python round() per group keeps the exact rounding of the scalar formula
+        combined_pct = {grp: round((1.0 - f) * 100.0, 2) for grp, f in failure.items()}
+
+        # Shots per (friendly, weapon name); a repeated name keeps its last non-zero count
+        name_code, name_uniques = pd.factorize(out["weapon"].astype(str))
+        name_key = gid * len(name_uniques) + name_code
+        plan_keys = name_key[valid][used > 0][::-1]
+        plan_keys, last = np.unique(plan_keys, return_index=True)
+        plan_counts = used[used > 0][::-1][last]
 
         # Label rows used in the plan and attach combined metrics
-        labeled = matches.copy()
-        used_mask = labeled["weapon"].astype(str).isin(plan_counts.keys())
-
-        labeled.loc[used_mask, "note"] = "COMBINED PLAN"
-        labeled.loc[used_mask, "combined_total_effectiveness_percent"] = combined_pct
-
-        # Per-weapon quantity used in the plan
-        labeled["qty_used"] = pd.NA  # default
-        for wname, cnt in plan_counts.items():
-            labeled.loc[labeled["weapon"].astype(str) == wname, "qty_used"] = cnt
-
-        # Clear combined metric on non-plan rows for clarity
-        labeled.loc[~used_mask, "combined_total_effectiveness_percent"] = pd.NA
-
-        return labeled
-
-    reduced = (
-        out.groupby(["friendly_id"], dropna=False, group_keys=False)
-           .apply(choose)
-           .reset_index(drop=True)
-    )
+        rows = np.flatnonzero(combined & np.isin(gid, list(combined_pct)))
+        at = np.minimum(np.searchsorted(plan_keys, name_key[rows]), len(plan_keys) - 1)
+        in_plan = plan_keys[at] == name_key[rows]
+        counts = plan_counts[at]
+
+        note = out["note"].to_numpy(dtype=object).copy()
+        note[rows[in_plan]] = "COMBINED PLAN"
+        pct = out["combined_total_effectiveness_percent"].to_numpy(dtype=object).copy()
+        pct[rows] = pd.NA
+        pct[rows[in_plan]] = [combined_pct[grp] for grp in gid[rows[in_plan]]]
+        qty_used = out["qty_used"].to_numpy(dtype=object).copy()
+        qty_used[rows] = pd.NA
+        qty_used[rows[in_plan]] = [int(c) for c in counts[in_plan]]
+
+        out["note"] = note
+        out["combined_total_effectiveness_percent"] = pct
+        out["qty_used"] = qty_used
+
+    # groupby.apply keeps the original row order when no group dropped a row,
+    # and lists rows group by group otherwise
+    if keep.all():
+        order = pos
+    else:
+        order = np.lexsort((pos, gid))
+        order = order[keep[order]]
+    reduced = out.iloc[order].reset_index(drop=True)
 
     # Preserve original column order (+ combined metrics)
     return reduced[cols]
@@ -453,7 +620,7 @@ def _reduce_matches_by_friendly(df: pd.DataFrame) -> pd.DataFrame:
 
 # ----------------------------- Execution -----------------------------
 
-def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
+def check_armaments(friendly_assets: Any, enemy_data: Any, snapshot: Any = None) -> str:
     """
     Returns a JSON string:
       {
@@ -465,9 +632,9 @@ def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
     friendly_list = _ensure_friendly_list(friendly_assets)
 
     # Classify enemy side
-    enemy_side = classify_enemy_side(enemy_data)
+    enemy_side = classify_enemy_side(enemy_data) or classify_enemy_side_from_snapshot(enemy_data, snapshot)
     rows: List[Dict[str, Any]] = []
-    cache: Dict[Tuple[str, str], pd.DataFrame] = {}
+    cache: Dict[Tuple[str, str], DeliverablesCatalog] = {}
 
     classified_any_friendly = False   # at least one friendly got a determinable side
     matched_any_overall = False       # at least one weapon matched across all assets
@@ -514,9 +681,10 @@ def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
 
         key = (fside, enemy_side)
         if key not in cache:
-            cache[key] = fetch_deliverables_df(fside, enemy_side)
+            cache[key] = fetch_catalog(fside, enemy_side)
 
-        cat_df = cache[key]
+        catalog = cache[key]
+        cat_df = catalog.df
         weapons = parse_weapons_field(asset.get("weapon"))
 
         if not weapons:
@@ -541,7 +709,7 @@ def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
         matched_any_this_asset = False
 
         for w in weapons:
-            match = _match_single_weapon(w, cat_df)
+            match = catalog.match(w)
             if match is None:
                 continue
 
@@ -567,15 +735,6 @@ def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
                 "sens_deliverables": sens_del
             }
 
-            if _val_present(row.get("effectiveness")) and isinstance(row.get("qty"), (int, float)):
-                total_percent, qty_needed, need_more = qty_to_reach_threshold(
-                    row.get("effectiveness"), row.get("qty"), threshold=0.9
-                )
-                row["total_effectiveness_percent"] = total_percent
-                row["qty_needed_for_90"] = qty_needed
-                if need_more:
-                    row["needs_more_note"] = need_more
-
             rows.append(row)
 
         if not matched_any_this_asset:
@@ -589,6 +748,9 @@ def check_armaments(friendly_assets: Any, enemy_data: Any) -> str:
                 "ea_deliverables": None, "comm_deliverables": None, "sens_deliverables": None
             })
 
+    # Shots to 90% for every matched weapon in one array call
+    _attach_qty_to_threshold(rows, threshold=0.9)
+
     if not classified_any_friendly:
         df_arm_results = pd.DataFrame(rows, columns=[
             "friendly_id","weapon","weapon_base_code","qty",
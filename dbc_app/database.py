@@ -1,12 +1,19 @@
 # establish connection to database. database functions that will pull and put into a dataframe that we can use.
 import psycopg2
 import pandas as pd
-from sqlalchemy import create_engine, text 
+from psycopg2 import extensions, sql
+from psycopg2.extras import execute_values
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 from dotenv import load_dotenv
-import datetime
+import atexit
+import threading
+import time
 import os
 import json
 
+import instrumentation
+
 # Database connection settings
 load_dotenv()
 DB_NAME = os.getenv("DB_NAME")
@@ -15,8 +22,35 @@ DB_PASSWORD = os.getenv("DB_PASSWORD")
 DB_HOST = os.getenv("DB_HOST")
 DB_PORT = os.getenv("DB_PORT")
 
+# Connection pool settings
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", "1"))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", "10"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))           # seconds to wait for a free connection
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", "300")) # seconds before an idle connection is reaped
+DB_POOL_CHECK_AFTER = float(os.getenv("DB_POOL_CHECK_AFTER", "30"))    # seconds idle before a health check on checkout
+
+# Bulk writes (BulkWriter)
+DB_BULK_FLUSH_SIZE = int(os.getenv("DB_BULK_FLUSH_SIZE", "100"))           # rows buffered before a write
+DB_BULK_FLUSH_INTERVAL = float(os.getenv("DB_BULK_FLUSH_INTERVAL", "1"))   # seconds between background flushes
+
+# Red deliverables/actionables cache
+CATALOG_TTL = float(os.getenv("CATALOG_TTL", "300"))  # seconds before a cached table is re-checked
+CATALOG_CHANGE_DETECTION = os.getenv("CATALOG_CHANGE_DETECTION", "1") not in ("0", "false", "False", "")
+
+# LISTEN/NOTIFY channel raised by inserts into user_input (and mef_data in queue mode)
+NOTIFY_CHANNEL = os.getenv("DB_NOTIFY_CHANNEL", "dbc_work")
+NOTIFY_TRIGGER = "dbc_notify_work"
+# Create/replace the triggers at startup; off by default, so the app only checks for them
+NOTIFY_INSTALL = os.getenv("DB_NOTIFY_INSTALL", "0") not in ("0", "false", "False", "")
+
+# Work-queue mode: claim every pending user_input / MEF row instead of only the newest
+QUEUE_MODE = os.getenv("DBC_QUEUE_MODE", "0") not in ("0", "false", "False", "")
+BATCH_MAX_SIZE = int(os.getenv("DBC_BATCH_MAX_SIZE", "50"))  # rows claimed per table per cycle
+QUEUE_COLUMN = "processed"
+
 # Make table name a variable
 mef_data = "mef_data_testing"
+COA_TABLE = "gronemeier_frontend_testing"
 red_air_act_a2a = "red_air_actionables_air_to_air"
 red_air_act_s2a = "red_air_actionables_surf_to_air"
 red_air_del_a2a = "red_air_deliverables_air_to_air"
@@ -38,599 +72,1068 @@ entity = "pae_data"
 user_input = "user_input"
 bc3_friends_vw = "bc3_friends_vw"
 
-def insert_data(entity: str, actions, message, timestamp) -> None:
+# Aircraft types that fill each support role
+AWACS_TYPES = ("E-3", "E3", "E7", "E-2C", "E2D")
+EW_TYPES = ("EA18G", "EC-130", "EA37B", "RC135VW", "RC-135")
+TANKER_TYPES = ("KC-135", "KC135", "KC46")
+
+
+# -----------------------------
+# Connection Pool
+# -----------------------------
+class CountingCursor(extensions.cursor):
+    """Cursor that reports every statement it sends to instrumentation as a round trip."""
+
+    def execute(self, query, vars=None):
+        instrumentation.round_trip()
+        return super().execute(query, vars)
+
+    def executemany(self, query, vars_list):
+        instrumentation.round_trip()
+        return super().executemany(query, vars_list)
+
+
+class PoolTimeout(Exception):
+    """Raised when no pooled connection frees up within DB_POOL_TIMEOUT."""
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections shared by every query in this module.
+
+    - At most `maxconn` connections are checked out at once; callers block for up to
+      `timeout` seconds waiting for one to be returned.
+    - Connections idle longer than `check_after` seconds are pinged with SELECT 1 before
+      being handed out; dead ones are dropped and replaced.
+    - Connections idle longer than `idle_timeout` seconds are closed, down to `minconn`.
+    """
+
+    def __init__(self, minconn, maxconn, timeout, idle_timeout, check_after):
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.check_after = check_after
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(maxconn)
+        self._idle = []  # (conn, last_used) pairs, most recently used last
+        self._in_use = 0
+        self._closed = False
+
+    def _connect(self):
+        return psycopg2.connect(
+            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD,
+            cursor_factory=CountingCursor,
+        )
+
+    def _healthy(self, conn, last_used):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.check_after:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute("SELECT 1;")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def reap_idle(self):
+        """Close connections that have sat idle past idle_timeout, keeping minconn warm."""
+        now = time.monotonic()
+        stale = []
+        with self._lock:
+            keep = []
+            # Newest first, so the most recently used connections are the ones kept warm
+            for conn, last_used in reversed(self._idle):
+                total = len(keep) + self._in_use
+                if now - last_used > self.idle_timeout and total >= self.minconn:
+                    stale.append(conn)
+                else:
+                    keep.append((conn, last_used))
+            self._idle = keep[::-1]
+        for conn in stale:
+            conn.close()
+
+    def getconn(self):
+        if self._closed:
+            raise PoolTimeout("connection pool is closed")
+        if not self._slots.acquire(timeout=self.timeout):
+            raise PoolTimeout(f"no database connection free after {self.timeout}s")
+        self.reap_idle()
+        try:
+            while True:
+                with self._lock:
+                    entry = self._idle.pop() if self._idle else None
+                if entry is None:
+                    conn = self._connect()
+                    break
+                conn, last_used = entry
+                if self._healthy(conn, last_used):
+                    break
+                conn.close()
+        except Exception:
+            self._slots.release()
+            raise
+        with self._lock:
+            self._in_use += 1
+        return conn
+
+    def putconn(self, conn, discard=False):
+        try:
+            if not discard and not conn.closed:
+                # Never hand out a connection with a transaction left open
+                if conn.info.transaction_status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+        except psycopg2.Error:
+            discard = True
+        with self._lock:
+            self._in_use -= 1
+            if discard or conn.closed or self._closed:
+                conn.close()
+            else:
+                self._idle.append((conn, time.monotonic()))
+        self._slots.release()
+
+    @contextmanager
+    def connection(self):
+        conn = self.getconn()
+        discard = False
+        try:
+            yield conn
+        except (psycopg2.OperationalError, psycopg2.InterfaceError):
+            discard = True
+            raise
+        finally:
+            self.putconn(conn, discard=discard)
+
+    def closeall(self):
+        with self._lock:
+            self._closed = True
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"in_use": self._in_use, "idle": len(self._idle), "max": self.maxconn}
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the process-wide pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = ConnectionPool(
+                    DB_POOL_MIN, DB_POOL_MAX, DB_POOL_TIMEOUT, DB_POOL_IDLE_TIMEOUT, DB_POOL_CHECK_AFTER
+                )
+    return _pool
+
+
+def get_connection():
+    """Context manager yielding a pooled connection; it is returned to the pool on exit."""
+    return get_pool().connection()
+
+
+# -----------------------------
+# Catalog Cache
+# -----------------------------
+@instrumentation.query
+def table_signature(table: str):
+    """
+    Cheap change probe: row count plus Postgres' insert/update/delete counter for the table.
+    Returns None when the probe itself fails.
+    """
+    query = sql.SQL("""
+        SELECT (SELECT count(*) FROM {tbl}),
+               (SELECT n_tup_ins + n_tup_upd + n_tup_del FROM pg_stat_user_tables WHERE relname = %s);
+    """).format(tbl=sql.Identifier(table))
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (table,))
+                return tuple(cur.fetchone())
+    except Exception as e:
+        print("Error probing table:", e)
+        return None
+
+
+class TableCache:
+    """
+    Process-lifetime cache of whole-table reads for the red deliverables/actionables tables.
+
+    An entry is served for `ttl` seconds. After that, with change detection on, the table's
+    signature is probed and the entry is renewed if it is unchanged; otherwise (or with
+    detection off) the table is re-read. An empty table is cached like any other; a read
+    that fails (fetch raises) is reported, counted in `errors` and returns an empty frame
+    without being cached, so the next call tries the database again.
+    """
+
+    def __init__(self, ttl, change_detection):
+        self.ttl = ttl
+        self.change_detection = change_detection
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+        self.read_seconds = {}  # table -> duration of its last database read
+        self._entries = {}  # table -> [df, expires_at, signature]
+        self._lock = threading.Lock()
+        self._fetch_locks = {}
+
+    def get(self, table, fetch):
+        entry = self._entries.get(table)
+        if entry is not None and time.monotonic() < entry[1]:
+            self.hits += 1
+            return entry[0]
+
+        # One thread refreshes a table while the others wait for its result
+        with self._lock:
+            fetch_lock = self._fetch_locks.setdefault(table, threading.Lock())
+        with fetch_lock:
+            entry = self._entries.get(table)
+            if entry is not None and time.monotonic() < entry[1]:
+                self.hits += 1
+                return entry[0]
+
+            signature = table_signature(table) if self.change_detection else None
+            if entry is not None and signature is not None and signature == entry[2]:
+                entry[1] = time.monotonic() + self.ttl
+                self.hits += 1
+                return entry[0]
+
+            self.misses += 1
+            try:
+                df = fetch()
+            except Exception as e:
+                print("Error:", e)
+                self.errors += 1
+                return pd.DataFrame()
+            self._entries[table] = [df, time.monotonic() + self.ttl, signature]
+            return df
+
+    def invalidate(self, table=None):
+        """Drop one table (or everything) so the next read goes to the database."""
+        with self._lock:
+            if table is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(table, None)
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "misses": self.misses, "errors": self.errors, "tables": len(self._entries),
+                "read_seconds": dict(self.read_seconds)}
+
+
+catalog_cache = TableCache(CATALOG_TTL, CATALOG_CHANGE_DETECTION)
+
+
+def invalidate_catalog_cache(table=None):
+    """Explicit invalidation hook, e.g. after reloading the weapon-effectiveness tables."""
+    catalog_cache.invalidate(table)
+
+
+# -----------------------------
+# Red Catalog Registry
+# -----------------------------
+# (family, kind, domain) -> table, kind being "act" (actionables) or "del" (deliverables).
+# A new catalog table only needs an entry here.
+RED_CATALOG = {
+    ("air", "act", "a2a"): red_air_act_a2a,
+    ("air", "act", "s2a"): red_air_act_s2a,
+    ("air", "del", "a2a"): red_air_del_a2a,
+    ("air", "del", "s2a"): red_air_del_s2a,
+    ("ground", "act", "a2s"): red_ground_act_a2s,
+    ("ground", "act", "drone"): red_ground_act_drone,
+    ("ground", "act", "s2s"): red_ground_act_s2s,
+    ("ground", "del", "a2s"): red_ground_del_a2s,
+    ("ground", "del", "drone"): red_ground_del_drone,
+    ("ground", "del", "s2s"): red_ground_del_s2s,
+    ("maritime", "act", "a2s"): red_maritime_act_a2s,
+    ("maritime", "act", "drone"): red_maritime_act_drone,
+    ("maritime", "act", "s2s"): red_maritime_act_s2s,
+    ("maritime", "del", "a2s"): red_maritime_del_a2s,
+    ("maritime", "del", "drone"): red_maritime_del_drone,
+    ("maritime", "del", "s2s"): red_maritime_del_s2s,
+}
+
+
+@instrumentation.query
+def read_table(table: str, columns=None, raise_errors: bool = False) -> pd.DataFrame:
+    """
+    One uncached SELECT of a whole table. The read time lands in catalog_cache.read_seconds.
+    A failed read returns an empty frame, or raises with raise_errors (what the cache uses
+    to tell a failure from an empty table).
+    """
+    df = pd.DataFrame()
+    try:
+        start = time.perf_counter()
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = sql.SQL("SELECT {cols} FROM {tbl};").format(
+                cols=select_list(columns), tbl=sql.Identifier(table)).as_string(conn)
+            df = pd.read_sql(query, conn)
+        catalog_cache.read_seconds[table] = time.perf_counter() - start
+    except Exception as e:
+        if raise_errors:
+            raise
+        print("Error:", e)
+    return df
+
+
+def fetch_table(table: str, columns=None, cache: bool = True) -> pd.DataFrame:
+    """
+    A catalog table through catalog_cache. The whole table is cached once and `columns`
+    are projected from it, so every projection shares one entry; with cache=False only
+    `columns` are read from the database.
+    """
+    if not cache:
+        return read_table(table, columns)
+    df = catalog_cache.get(table, lambda: read_table(table, raise_errors=True))
+    if columns and not df.empty:
+        return df[[column for column in columns if column in df.columns]]
+    return df
+
+
+def fetch_catalog(family: str, kind: str, domain: str, columns=None, cache: bool = True) -> pd.DataFrame:
+    """Red catalog table by registry key, e.g. fetch_catalog("air", "del", "a2a")."""
+    return fetch_table(RED_CATALOG[(family, kind, domain)], columns, cache)
+
+
+def prefetch_all(workers: int = None) -> dict:
+    """
+    Load every RED_CATALOG table into catalog_cache in one parallel round, for startup.
+    Returns table -> rows read (0 when a read failed or the table is empty).
+    """
+    tables = list(dict.fromkeys(RED_CATALOG.values()))
+    workers = max(1, min(workers or DB_POOL_MAX, len(tables)))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        frames = pool.map(fetch_table, tables)
+        return {table: len(df) for table, df in zip(tables, frames)}
+
+
+@instrumentation.query
+def insert_data(entity: str, actions, message, timestamp) -> bool:
+    """Insert one MEF row. Returns True once it is committed."""
     print(timestamp)
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = "INSERT INTO mef_data_testing (entity, actions, message, timestamp) VALUES (%s, %s, %s, %s);"
-        params = (entity, actions, message, timestamp)  # <-- fixed here
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-        conn.commit()  # don't forget to commit
-        print(f"{entity},{actions},{ message},{timestamp}")
+        with get_connection() as conn:
+            query = "INSERT INTO mef_data_testing (entity, actions, message, timestamp) VALUES (%s, %s, %s, %s);"
+            params = (entity, actions, message, timestamp)  # <-- fixed here
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+            conn.commit()  # don't forget to commit
+            print(f"{entity},{actions},{ message},{timestamp}")
+        return True
     except Exception as e:
         print("Error:", e)
-    finally:
-        if conn:
-            conn.close()
+        return False
 
-def push_coa_to_db(target_aircraft_id: str, coa: dict, target_message: str, target_time: str, table_name: str = "gronemeier_frontend_testing"):
+@instrumentation.query
+def insert_data_many(rows) -> int:
+    """
+    Insert many (entity, actions, message, timestamp) MEF rows in one statement and one
+    transaction. Returns the number of rows written (0 when the batch failed).
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
     try:
-        # Convert COA to JSON string
-        coa_json = json.dumps(coa) if coa else None
-
-        # Validation check
-        if not target_aircraft_id:
-            print("Skipping insert: target_aircraft_id is null/empty")
-            return
-        if not target_time:
-            print("Skipping insert: target_time is null/empty")
-            return
-        if not coa_json or coa_json == "[]":
-            print("Skipping insert: coa_json is null/empty")
-            return
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO {mef_data} (entity, actions, message, timestamp) VALUES %s",
+                    rows,
+                    page_size=len(rows),
+                )
+            conn.commit()
+        print(f"Inserted {len(rows)} MEF rows into {mef_data}")
+        return len(rows)
+    except Exception as e:
+        print("Error:", e)
+        return 0
+
+def _coa_values(target_aircraft_id, coa, target_message, target_time):
+    """Row for the COA table, or None (with the reason printed) when it should be skipped."""
+    # Convert COA to JSON string
+    coa_json = json.dumps(coa) if coa else None
+
+    # Validation check
+    if not target_aircraft_id:
+        print("Skipping insert: target_aircraft_id is null/empty")
+        return None
+    if not target_time:
+        print("Skipping insert: target_time is null/empty")
+        return None
+    if not coa_json or coa_json == "[]":
+        print("Skipping insert: coa_json is null/empty")
+        return None
+    return (target_aircraft_id, coa_json, target_message, target_time)
+
+@instrumentation.query
+def push_coa_to_db(target_aircraft_id: str, coa: dict, target_message: str, target_time: str, table_name: str = COA_TABLE) -> bool:
+    """Insert one COA. Returns True once it is committed, False when skipped or failed."""
+    try:
+        values = _coa_values(target_aircraft_id, coa, target_message, target_time)
+        if values is None:
+            return False
 
         # Connect and insert if all checks pass
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        with conn.cursor() as cur:
-            insert_query = f"""
-            INSERT INTO {table_name} (entity, five_line, message, timestamp)
-            VALUES (%s, %s, %s, %s)
-            """
-            cur.execute(insert_query, (target_aircraft_id, coa_json, target_message, target_time))
-            conn.commit()
-            print(f"Inserted COA for target {target_aircraft_id} into {table_name}")
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                insert_query = f"""
+                INSERT INTO {table_name} (entity, five_line, message, timestamp)
+                VALUES (%s, %s, %s, %s)
+                """
+                cur.execute(insert_query, values)
+                conn.commit()
+                print(f"Inserted COA for target {target_aircraft_id} into {table_name}")
+        return True
 
     except Exception as e:
         print("Error inserting COA:", e)
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-
+        return False
 
-def query_assets(column: str, operator:str, filter: str) -> list:
+@instrumentation.query
+def push_coa_many(rows, table_name: str = COA_TABLE) -> int:
+    """
+    Write many (target_aircraft_id, coa, target_message, target_time) COAs in one statement
+    and one transaction, skipping the ones push_coa_to_db would skip.
+    Returns the number of rows written (0 when the batch failed).
+    """
+    values = []
+    for row in rows:
+        try:
+            row_values = _coa_values(*row)
+        except Exception as e:
+            print("Error inserting COA:", e)
+            continue
+        if row_values is not None:
+            values.append(row_values)
+    if not values:
+        return 0
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                execute_values(
+                    cur,
+                    f"INSERT INTO {table_name} (entity, five_line, message, timestamp) VALUES %s",
+                    values,
+                    page_size=len(values),
+                )
+            conn.commit()
+        print(f"Inserted {len(values)} COAs into {table_name}")
+        return len(values)
+    except Exception as e:
+        print("Error inserting COA:", e)
+        return 0
+
+
+class BulkWriter:
+    """
+    Buffer rows for one of the *_many writers and hand them over in batches:
+    as soon as `flush_size` rows are waiting, every `flush_interval` seconds from a
+    background thread, and on flush()/close(). Rows of a failed batch are dropped
+    (and reported), the same as a failed single-row insert.
+    """
+
+    def __init__(self, write_many, flush_size: int = DB_BULK_FLUSH_SIZE,
+                 flush_interval: float = DB_BULK_FLUSH_INTERVAL):
+        self._write_many = write_many
+        self.flush_size = max(int(flush_size), 1)
+        self.flush_interval = flush_interval
+        self._rows = []
+        self._lock = threading.Lock()        # guards _rows
+        self._flush_lock = threading.Lock()  # one batch in flight at a time, keeps rows in order
+        self._stop = threading.Event()
+        self._thread = None
+        if flush_interval and flush_interval > 0:
+            self._thread = threading.Thread(target=self._run, name="bulk-writer", daemon=True)
+            self._thread.start()
+        atexit.register(self.close)
+
+    def add(self, row: tuple):
+        with self._lock:
+            self._rows.append(row)
+            full = len(self._rows) >= self.flush_size
+        if full:
+            self.flush()
+
+    def pending(self) -> int:
+        with self._lock:
+            return len(self._rows)
+
+    def flush(self) -> int:
+        with self._flush_lock:
+            with self._lock:
+                rows, self._rows = self._rows, []
+            if not rows:
+                return 0
+            return self._write_many(rows)
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print("Error flushing bulk writes:", e)
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+
+
+def select_list(columns=None) -> sql.Composable:
+    """
+    SELECT list for a projection: the quoted column names, or * when columns is None.
+    Every bc3_with_all_vw read takes `columns` so callers only fetch what they use.
+    snapshot.load passes none: its picture feeds whole rows into the support report.
+    """
+    if not columns:
+        return sql.SQL("*")
+    return sql.SQL(", ").join(sql.Identifier(column) for column in columns)
+
+@instrumentation.query
+def query_assets(column: str, operator:str, filter: str, columns=None) -> list:
     results = []
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-
-        # Use parameterized query to prevent SQL injection
-        query = f"SELECT * FROM {bc3_with_all_vw} WHERE {column} {operator} '{filter}' AND aircraft_type NOT LIKE 'DIS(265)';"
-        with conn.cursor() as cur:
-            cur.execute(query,)
-            columns = [desc[0] for desc in cur.description]
-            for row in cur.fetchall():
-                results.append(dict(zip(columns, row)))
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            # Use parameterized query to prevent SQL injection
+            query = sql.SQL(
+                "SELECT {cols} FROM {tbl} WHERE {col} " + operator + " %s AND aircraft_type NOT LIKE 'DIS(265)';"
+            ).format(cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw), col=sql.Identifier(column))
+            with conn.cursor() as cur:
+                cur.execute(query, (filter,))
+                columns = [desc[0] for desc in cur.description]
+                for row in cur.fetchall():
+                    results.append(dict(zip(columns, row)))
     except Exception as e:
         print("Error:", e)
-    finally:
-        if 'conn' in locals():
-            conn.close()
     return results
 
-def query_awacs() -> list:
+@instrumentation.query
+def query_awacs(columns=None) -> list:
     results = []
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = """
-            SELECT * FROM bc3_with_all_vw
-            WHERE aircraft_type IN (%s, %s, %s, %s, %s)
-            AND bc3_jtn IS NOT NULL
-            AND bc3_jtn != '[null]';
-        """
-        params = ("E-3", "E3", "E7", "E-2C", "E2D")
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            columns = [desc[0] for desc in cur.description]
-            for row in cur.fetchall():
-                results.append(dict(zip(columns, row)))
+        with get_connection() as conn:
+            query = sql.SQL("""
+                SELECT {cols} FROM bc3_with_all_vw
+                WHERE aircraft_type IN (%s, %s, %s, %s, %s)
+                AND bc3_jtn IS NOT NULL
+                AND bc3_jtn != '[null]';
+            """).format(cols=select_list(columns))
+            params = AWACS_TYPES
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                columns = [desc[0] for desc in cur.description]
+                for row in cur.fetchall():
+                    results.append(dict(zip(columns, row)))
     except Exception as e:
         print("Error:", e)
-    finally:
-        if 'conn' in locals():
-            conn.close()
     return results
 
-def query_ew() -> list:
+@instrumentation.query
+def query_ew(columns=None) -> list:
     results = []
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = """
-            SELECT * FROM bc3_with_all_vw
-            WHERE aircraft_type IN (%s, %s, %s, %s, %s)
-            AND bc3_jtn IS NOT NULL
-            AND bc3_jtn != '[null]'
-            AND trackid = 'Friend';
-        """
-        params = ("EA18G", "EC-130", "EA37B", "RC135VW", "RC-135")
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            columns = [desc[0] for desc in cur.description]
-            for row in cur.fetchall():
-                results.append(dict(zip(columns, row)))
+        with get_connection() as conn:
+            query = sql.SQL("""
+                SELECT {cols} FROM bc3_with_all_vw
+                WHERE aircraft_type IN (%s, %s, %s, %s, %s)
+                AND bc3_jtn IS NOT NULL
+                AND bc3_jtn != '[null]'
+                AND trackid = 'Friend';
+            """).format(cols=select_list(columns))
+            params = EW_TYPES
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                columns = [desc[0] for desc in cur.description]
+                for row in cur.fetchall():
+                    results.append(dict(zip(columns, row)))
     except Exception as e:
         print("Error:", e)
-    finally:
-        if 'conn' in locals():
-            conn.close()
     return results
 
-def query_tankers() -> list:
+@instrumentation.query
+def query_tankers(columns=None) -> list:
     results = []
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = """
-            SELECT * FROM bc3_with_all_vw
-            WHERE aircraft_type IN (%s, %s, %s)
-            AND bc3_jtn IS NOT NULL
-            AND bc3_jtn != '[null]';
-        """
-        params = ("KC-135", "KC135", "KC46")
-        with conn.cursor() as cur:
-            cur.execute(query, params)
-            columns = [desc[0] for desc in cur.description]
-            for row in cur.fetchall():
-                results.append(dict(zip(columns, row)))
+        with get_connection() as conn:
+            query = sql.SQL("""
+                SELECT {cols} FROM bc3_with_all_vw
+                WHERE aircraft_type IN (%s, %s, %s)
+                AND bc3_jtn IS NOT NULL
+                AND bc3_jtn != '[null]';
+            """).format(cols=select_list(columns))
+            params = TANKER_TYPES
+            with conn.cursor() as cur:
+                cur.execute(query, params)
+                columns = [desc[0] for desc in cur.description]
+                for row in cur.fetchall():
+                    results.append(dict(zip(columns, row)))
     except Exception as e:
         print("Error:", e)
-    finally:
-        if 'conn' in locals():
-            conn.close()
     return results
 
 
 
 
     # Use pandas to fetch the data
-def query_friendly_asset(bc3_jtn: str) -> pd.DataFrame:
-    df_friendly_asset = pd.DataFrame()
+@instrumentation.query
+def query_support_candidates(roles=None, columns=None) -> pd.DataFrame:
+    """
+    Tanker, AWACS, EW, SEAD and escort candidates in one query, each row tagged with its
+    role in a leading "role" column. Same filters as query_tankers / query_awacs /
+    query_ew and query_assets("weapon", "ILIKE", "%AGM-88%" / "%AIM-120%"); a track
+    filling several roles comes back once per role.
+    roles maps each role to read to geo.bounding_box() boxes, or None for the whole view
+    (default: every role, unboxed). Errors are raised, as in query_bc3_in_box.
+    """
+    df_candidates = pd.DataFrame()
+    by_type = """
+        SELECT {role} AS role, {cols} FROM {tbl}
+        WHERE aircraft_type = ANY(%s)
+        AND bc3_jtn IS NOT NULL
+        AND bc3_jtn != '[null]'
+    """
+    by_weapon = """
+        SELECT {role} AS role, {cols} FROM {tbl}
+        WHERE weapon ILIKE %s AND aircraft_type NOT LIKE 'DIS(265)'
+    """
+    branches = {
+        "tankers": (by_type, list(TANKER_TYPES)),
+        "awacs": (by_type, list(AWACS_TYPES)),
+        "ew": (by_type + " AND trackid = 'Friend'", list(EW_TYPES)),
+        "sead": (by_weapon, "%AGM-88%"),
+        "escorts": (by_weapon, "%AIM-120%"),
+    }
+    if roles is None:
+        roles = dict.fromkeys(branches)
+    if not roles:
+        return df_candidates
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
+        selects, params = [], []
+        for role, boxes in roles.items():
+            template, param = branches[role]
+            where, box_params = _box_filter(boxes)
+            selects.append((template + " AND " + where, role))
+            params += [param] + box_params
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = sql.SQL(" UNION ALL ").join(
+                sql.SQL(template).format(role=sql.Literal(role), cols=select_list(columns),
+                                         tbl=sql.Identifier(bc3_with_all_vw))
+                for template, role in selects
+            ).as_string(conn)
+            df_candidates = pd.read_sql(query, conn, params=params)
 
-        # Use parameterized query to prevent SQL injection
-        query = f"SELECT * FROM {bc3_with_all_vw} WHERE bc3_jtn = %s;"
-        df_friendly_asset = pd.read_sql(query, conn, params=(bc3_jtn,))
-        
     except Exception as e:
         print("Error:", e)
+        raise
 
-    finally:
-        if 'conn' in locals():
-            conn.close()
-
-    return df_friendly_asset
+    return df_candidates
 
 
-def query_mef(): 
-    df_mef_data = pd.DataFrame()
+@instrumentation.query
+def query_friendly_asset(bc3_jtn: str, columns=None) -> pd.DataFrame:
+    df_friendly_asset = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {mef_data} order by timestamp desc limit 1;"
-        df_mef_data = pd.read_sql(query, conn)
-
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            # Use parameterized query to prevent SQL injection
+            query = sql.SQL("SELECT {cols} FROM {tbl} WHERE bc3_jtn = %s;").format(
+                cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw)).as_string(conn)
+            df_friendly_asset = pd.read_sql(query, conn, params=(bc3_jtn,))
+        
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
+    return df_friendly_asset
 
-    return df_mef_data
 
-def query_all_mef(): 
-    df_mef_data = pd.DataFrame()
+@instrumentation.query
+def query_friendly_assets(bc3_jtns, columns=None) -> pd.DataFrame:
+    """query_friendly_asset() for several JTNs in one round trip; include bc3_jtn in `columns` to tell rows apart."""
+    df_friendly_assets = pd.DataFrame()
+    if not bc3_jtns:
+        return df_friendly_assets
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {mef_data} order by timestamp desc;"
-        df_mef_data = pd.read_sql(query, conn)
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = sql.SQL("SELECT {cols} FROM {tbl} WHERE bc3_jtn = ANY(%s);").format(
+                cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw)).as_string(conn)
+            df_friendly_assets = pd.read_sql(query, conn, params=(list(bc3_jtns),))
 
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-
-    return df_mef_data
+    return df_friendly_assets
 
 
-def query_red_air_act_a2a():
-    df_red_air_act_a2a = pd.DataFrame()
+@instrumentation.query
+def query_mef(): 
+    df_mef_data = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_air_act_a2a};"
-        df_red_air_act_a2a = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_air_act_a2a
-
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = f"SELECT * FROM {mef_data} order by timestamp desc limit 1;"
+            df_mef_data = pd.read_sql(query, conn)
 
-def query_red_air_act_s2a():
-    df_red_air_act_s2a = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_air_act_s2a};"
-        df_red_air_act_s2a = pd.read_sql(query, conn)
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-
-    return df_red_air_act_s2a
-
+    return df_mef_data
 
-def query_red_air_del_a2a():
-    df_red_air_del_a2a = pd.DataFrame()
+@instrumentation.query
+def query_all_mef(): 
+    df_mef_data = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_air_del_a2a};"
-        df_red_air_del_a2a = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = f"SELECT * FROM {mef_data} order by timestamp desc;"
+            df_mef_data = pd.read_sql(query, conn)
 
-    return df_red_air_del_a2a
-
-
-def query_red_air_del_s2a():
-    df_red_air_del_s2a = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_air_del_s2a};"
-        df_red_air_del_s2a = pd.read_sql(query, conn)
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_air_del_s2a
-
+    return df_mef_data
 
-def query_red_ground_act_a2s():
-    df_red_ground_act_a2s = pd.DataFrame()
+@instrumentation.query
+def query_mef_since(last_seen=None):
+    """
+    MEF rows with timestamp >= last_seen (every row when last_seen is None), oldest first.
+    Only the columns user_input's dedup index reads.
+    """
+    df_mef_data = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_act_a2s};"
-        df_red_ground_act_a2s = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_act_a2s
-
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            if last_seen is None:
+                query = f"SELECT entity, actions, timestamp FROM {mef_data} order by timestamp;"
+                df_mef_data = pd.read_sql(query, conn)
+            else:
+                query = f"SELECT entity, actions, timestamp FROM {mef_data} WHERE timestamp >= %s order by timestamp;"
+                df_mef_data = pd.read_sql(query, conn, params=(last_seen,))
 
-def query_red_ground_act_drone():
-    df_red_ground_act_drone = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_act_drone};"
-        df_red_ground_act_drone = pd.read_sql(query, conn)
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_act_drone
+    return df_mef_data
 
 
-def query_red_ground_act_s2s():
-    df_red_ground_act_s2s = pd.DataFrame()
+    #Show preview of data
+@instrumentation.query
+def query_bc3_with_all_vw(columns=None, raise_errors: bool = False):
+    """Every bc3_with_all_vw row. A failed read returns an empty frame, or raises with raise_errors."""
+    df_bc3_with_all_vw = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_act_s2s};"
-        df_red_ground_act_s2s = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_act_s2s
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = sql.SQL("SELECT {cols} FROM {tbl};").format(
+                cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw)).as_string(conn)
+            df_bc3_with_all_vw = pd.read_sql(query, conn)
 
-
-def query_red_ground_del_a2s():
-    df_red_ground_del_a2s = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_del_a2s};"
-        df_red_ground_del_a2s = pd.read_sql(query, conn)
     except Exception as e:
+        if raise_errors:
+            raise
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_del_a2s
-
+    return df_bc3_with_all_vw 
 
-def query_red_ground_del_drone():
-    df_red_ground_del_drone = pd.DataFrame()
+# Text that casts cleanly to float8 (no braces: the fragment goes through sql.SQL.format)
+_NUMERIC_RE = r"^\s*[-+]?([0-9]+[.]?[0-9]*|[.][0-9]+)([eE][-+]?[0-9]+)?\s*$"
+
+def _as_float8(column):
+    """SQL for column::float8 that is NULL (not an error) when the value is not a number."""
+    return f"(CASE WHEN {column}::text ~ '{_NUMERIC_RE}' THEN {column}::float8 END)"
+
+def _box_filter(boxes):
+    """
+    WHERE fragment and params for geo.bounding_box() boxes.
+    None (a radius covering the globe) filters nothing. Rows whose latitude or longitude
+    is not numeric fall outside every box instead of failing the whole query.
+    """
+    if boxes is None:
+        return "TRUE", []
+    clauses, params = [], []
+    lat, lon = _as_float8("latitude"), _as_float8("longitude")
+    for lat_min, lat_max, lon_min, lon_max in boxes:
+        clauses.append(f"({lat} BETWEEN %s AND %s AND {lon} BETWEEN %s AND %s)")
+        params.extend([lat_min, lat_max, lon_min, lon_max])
+    return "(" + " OR ".join(clauses) + ")", params
+
+@instrumentation.query
+def query_bc3_in_box(boxes, trackid: str = None, columns=None) -> pd.DataFrame:
+    """
+    bc3_with_all_vw rows inside geo.bounding_box() boxes, optionally of one trackid only.
+    Errors are raised: an empty frame here would read as "nothing in range".
+    Only callers without a WorldSnapshot read through boxes; snapshot.load reads the
+    whole view once per cycle.
+    """
+    df_bc3_with_all_vw = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_del_drone};"
-        df_red_ground_del_drone = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_del_drone
-
+        where, params = _box_filter(boxes)
+        if trackid is not None:
+            where += " AND trackid = %s"
+            params.append(trackid)
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = sql.SQL("SELECT {cols} FROM {tbl} WHERE " + where + ";").format(
+                cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw)).as_string(conn)
+            df_bc3_with_all_vw = pd.read_sql(query, conn, params=params)
 
-def query_red_ground_del_s2s():
-    df_red_ground_del_s2s = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_ground_del_s2s};"
-        df_red_ground_del_s2s = pd.read_sql(query, conn)
     except Exception as e:
         print("Error:", e)
+        raise
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_ground_del_s2s
-
+    return df_bc3_with_all_vw
 
-def query_red_maritime_act_a2s():
-    df_red_maritime_act_a2s = pd.DataFrame()
+@instrumentation.query
+def query_user_input():
+    df_user_input = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_act_a2s};"
-        df_red_maritime_act_a2s = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = f"SELECT * FROM {user_input} order by timestamp desc limit 1;"
+            df_user_input = pd.read_sql(query, conn)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_act_a2s
-
-
-def query_red_maritime_act_drone():
-    df_red_maritime_act_drone = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_act_drone};"
-        df_red_maritime_act_drone = pd.read_sql(query, conn)
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_act_drone
-
+    return df_user_input 
 
-def query_red_maritime_act_s2s():
-    df_red_maritime_act_s2s = pd.DataFrame()
+@instrumentation.query
+def query_bc3_friends_vw(raise_errors: bool = False):
+    """Every bc3_friends_vw row. A failed read returns an empty frame, or raises with raise_errors."""
+    df_bv3_friends_vw = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_act_s2s};"
-        df_red_maritime_act_s2s = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
-
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_act_s2s
+        # Borrow a pooled connection
+        with get_connection() as conn:
+            query = f"SELECT * FROM {bc3_friends_vw};"
+            df_bv3_friends_vw = pd.read_sql(query, conn)
 
-
-def query_red_maritime_del_a2s():
-    df_red_maritime_del_a2s = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_del_a2s};"
-        df_red_maritime_del_a2s = pd.read_sql(query, conn)
     except Exception as e:
+        if raise_errors:
+            raise
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_del_a2s
-
+    return df_bv3_friends_vw 
 
-def query_red_maritime_del_drone():
-    df_red_maritime_del_drone = pd.DataFrame()
+@instrumentation.query
+def get_groundspeed(identifier: str, columns=None) -> pd.DataFrame:
+    # print(identifier)
+    groundspeed = pd.DataFrame()
     try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_del_drone};"
-        df_red_maritime_del_drone = pd.read_sql(query, conn)
+        with get_connection() as conn:
+            query = sql.SQL("SELECT {cols} FROM {tbl} WHERE tracknumber = %s;").format(
+                cols=select_list(columns), tbl=sql.Identifier(bc3_with_all_vw)).as_string(conn)
+            groundspeed = pd.read_sql(query, conn, params=(identifier,))
     except Exception as e:
         print("Error:", e)
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_del_drone
-
+    return groundspeed
 
-def query_red_maritime_del_s2s():
-    df_red_maritime_del_s2s = pd.DataFrame()
-    try:
-        # Connect to PostgreSQL
-        conn = psycopg2.connect(
-            host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
-        )
-        query = f"SELECT * FROM {red_maritime_del_s2s};"
-        df_red_maritime_del_s2s = pd.read_sql(query, conn)
-    except Exception as e:
-        print("Error:", e)
+import pandas as pd
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return df_red_maritime_del_s2s
 
-    #Show preview of data
-def query_bc3_with_all_vw():
-    df_bc3_with_all_vw = pd.DataFrame()
+@instrumentation.query
+def record_exists(asset_tn, target_tn):
     try:
-        # Create SQLAlchemy engine
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
-
-        query = f"SELECT * FROM {bc3_with_all_vw};"
-        df_bc3_with_all_vw = pd.read_sql(query, con=engine)
+        # Borrow a pooled connection
+        query = "SELECT EXISTS (SELECT 1 FROM user_input WHERE asset_tn = %s AND target_tn = %s);"
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (asset_tn, target_tn))
+                result = cur.fetchone()[0]
+            print(result)
+            return result
 
     except Exception as e:
-        print("Error:", e)
-
-    return df_bc3_with_all_vw 
+        print("Error checking record existence:", e)
+        return False
 
-def query_user_input():
-    df_user_input = pd.DataFrame()
-    try:
-        # Create SQLAlchemy engine
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
 
-        query = f"SELECT * FROM {user_input} order by timestamp desc limit 1;"
-        df_user_input = pd.read_sql(query, con=engine)
+# -----------------------------
+# LISTEN/NOTIFY
+# -----------------------------
+def notify_tables() -> tuple:
+    """
+    Tables whose inserts should wake the app. The app writes mef_data itself from
+    user_input, so outside queue mode those inserts would only wake it for its own work.
+    """
+    return (user_input, mef_data) if QUEUE_MODE else (user_input,)
+
+
+def install_notify_triggers(install: bool = NOTIFY_INSTALL) -> bool:
+    """
+    Make sure the statement-level triggers that NOTIFY NOTIFY_CHANNEL (payload: table name)
+    on inserts into notify_tables() are in place. With `install` (DB_NOTIFY_INSTALL) they
+    are created, and dropped from the other work table; otherwise this only checks that a
+    DBA installed them. Returns True when every table has its trigger.
+    """
+    tables = notify_tables()
+    if install:
+        function_ddl = sql.SQL("""
+            CREATE OR REPLACE FUNCTION {fn}() RETURNS trigger AS $$
+            BEGIN
+                PERFORM pg_notify(TG_ARGV[0], TG_TABLE_NAME);
+                RETURN NULL;
+            END;
+            $$ LANGUAGE plpgsql;
+        """).format(fn=sql.Identifier(NOTIFY_TRIGGER))
+        drop_ddl = sql.SQL("DROP TRIGGER IF EXISTS {trg} ON {tbl};")
+        create_ddl = sql.SQL("""
+            CREATE TRIGGER {trg} AFTER INSERT ON {tbl}
+            FOR EACH STATEMENT EXECUTE FUNCTION {fn}({channel});
+        """)
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute(function_ddl)
+                    for table in (user_input, mef_data):
+                        cur.execute(drop_ddl.format(trg=sql.Identifier(NOTIFY_TRIGGER), tbl=sql.Identifier(table)))
+                        if table in tables:
+                            cur.execute(create_ddl.format(
+                                trg=sql.Identifier(NOTIFY_TRIGGER),
+                                tbl=sql.Identifier(table),
+                                fn=sql.Identifier(NOTIFY_TRIGGER),
+                                channel=sql.Literal(NOTIFY_CHANNEL),
+                            ))
+                conn.commit()
+            return True
+        except Exception as e:
+            print("Error installing notify triggers:", e)
 
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT c.relname FROM pg_trigger t JOIN pg_class c ON c.oid = t.tgrelid
+                    WHERE t.tgname = %s;
+                """, (NOTIFY_TRIGGER,))
+                installed = {row[0] for row in cur.fetchall()}
+        return set(tables) <= installed
     except Exception as e:
-        print("Error:", e)
+        print("Error checking notify triggers:", e)
+        return False
 
-    return df_user_input 
 
-def query_bc3_friends_vw():
-    df_bv3_friends_vw = pd.DataFrame()
-    try:
-        # Create SQLAlchemy engine
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
+# -----------------------------
+# Work queue
+# -----------------------------
+_queue_ready = False
+_queue_lock = threading.Lock()
+
+
+def install_queue_columns() -> bool:
+    """
+    Add the QUEUE_COLUMN flag to user_input and mef_data if it is missing.
+    Rows that exist when the column is added start out processed (DEFAULT true), rows
+    inserted afterwards start out pending (DEFAULT false), so switching queue mode on
+    does not replay the whole history.
+    """
+    global _queue_ready
+    with _queue_lock:
+        if _queue_ready:
+            return True
+        ddl = sql.SQL("""
+            ALTER TABLE {tbl} ADD COLUMN IF NOT EXISTS {col} boolean NOT NULL DEFAULT true;
+            ALTER TABLE {tbl} ALTER COLUMN {col} SET DEFAULT false;
+        """)
+        try:
+            with get_connection() as conn:
+                with conn.cursor() as cur:
+                    for table in (user_input, mef_data):
+                        cur.execute(ddl.format(tbl=sql.Identifier(table), col=sql.Identifier(QUEUE_COLUMN)))
+                conn.commit()
+            _queue_ready = True
+        except Exception as e:
+            print("Error installing queue columns:", e)
+        return _queue_ready
+
+
+@instrumentation.query
+def claim_pending(table: str, limit: int = BATCH_MAX_SIZE) -> pd.DataFrame:
+    """
+    Mark up to `limit` pending rows of `table` processed and return them, oldest first.
+    SKIP LOCKED lets several app instances drain the same table without handing out a row
+    twice. Claiming commits before evaluation, so a row whose evaluation fails is not retried.
+    """
+    df_claimed = pd.DataFrame()
+    if not install_queue_columns():
+        return df_claimed
+    query = sql.SQL("""
+        UPDATE {tbl} SET {col} = true
+        WHERE ctid IN (
+            SELECT ctid FROM {tbl}
+            WHERE NOT {col}
+            ORDER BY timestamp
+            LIMIT %s
+            FOR UPDATE SKIP LOCKED
         )
-
-        query = f"SELECT * FROM {bc3_friends_vw};"
-        df_bv3_friends_vw = pd.read_sql(query, con=engine)
-
+        RETURNING *;
+    """).format(tbl=sql.Identifier(table), col=sql.Identifier(QUEUE_COLUMN))
+    try:
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query, (limit,))
+                columns = [desc[0] for desc in cur.description]
+                df_claimed = pd.DataFrame(cur.fetchall(), columns=columns)
+            conn.commit()
     except Exception as e:
         print("Error:", e)
+        return pd.DataFrame()
 
-    return df_bv3_friends_vw 
+    if "timestamp" in df_claimed.columns:
+        # RETURNING does not keep the subquery's order
+        df_claimed = df_claimed.sort_values("timestamp", kind="stable").reset_index(drop=True)
+    return df_claimed
 
-def get_groundspeed(identifier: str) -> pd.DataFrame:
-    # print(identifier)
-    groundspeed = pd.DataFrame()
+
+@instrumentation.query
+def count_pending(table: str):
+    """Rows of `table` not yet claimed, or None when the count fails."""
+    if not install_queue_columns():
+        return None
+    query = sql.SQL("SELECT count(*) FROM {tbl} WHERE NOT {col};").format(
+        tbl=sql.Identifier(table), col=sql.Identifier(QUEUE_COLUMN))
     try:
-        conn = psycopg2.connect(
-            host=DB_HOST,
-            port=DB_PORT,
-            dbname=DB_NAME,
-            user=DB_USER,
-            password=DB_PASSWORD,
-        )
-        query = f"SELECT * FROM {bc3_with_all_vw} WHERE tracknumber = %s;"
-        groundspeed = pd.read_sql(query, conn, params=(identifier,))
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(query)
+                return cur.fetchone()[0]
     except Exception as e:
         print("Error:", e)
+        return None
 
-    finally:
-        if "conn" in locals():
-            conn.close()
-    return groundspeed
 
-import pandas as pd
+def claim_user_input(limit: int = BATCH_MAX_SIZE) -> pd.DataFrame:
+    return claim_pending(user_input, limit)
 
 
-def record_exists(asset_tn, target_tn):
-    try:
-        # Create SQLAlchemy engine
-        engine = create_engine(
-            f"postgresql+psycopg2://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}"
-        )
+def claim_mef(limit: int = BATCH_MAX_SIZE) -> pd.DataFrame:
+    return claim_pending(mef_data, limit)
 
-        query = text("SELECT EXISTS (SELECT 1 FROM user_input WHERE asset_tn = :asset AND target_tn = :target);")
-        with engine.connect() as conn:
-            result = conn.execute(query, {"asset": asset_tn, "target": target_tn}).scalar()
-            print(result)
-            return result
 
-    except Exception as e:
-        print("Error checking record existence:", e)
-        return False
+def open_listen_connection(channel: str = NOTIFY_CHANNEL):
+    """
+    Open a dedicated autocommit connection LISTENing on `channel`.
+    It is kept out of the pool because it has to stay subscribed for the life of the process.
+    """
+    conn = psycopg2.connect(
+        host=DB_HOST, port=DB_PORT, dbname=DB_NAME, user=DB_USER, password=DB_PASSWORD
+    )
+    conn.set_session(autocommit=True)
+    with conn.cursor() as cur:
+        cur.execute(sql.SQL("LISTEN {};").format(sql.Identifier(channel)))
+    return conn
@@ -3,6 +3,7 @@
 import re
 from collections import Counter
 import random
+import track_parser
 
 cyber_ids = ["Cereal", "Condor", "Light", "Wolf"]
 space_ids = ["Photon", "Astro", "Pluto", "Vader", "JarJar", "Roo"]
@@ -13,6 +14,14 @@ def extract_target_name(line: str) -> str | None:
     if not line or not isinstance(line, str):
         return None
 
+    # 0) Well-formed "<tracknumber> (CallSign: ..., ...)" entity strings
+    track = track_parser.parse_target(line)
+    if track is not None:
+        if track.callsign:
+            return track.callsign
+        if len(track.track_id) >= 5:
+            return track.track_id[:5]
+
     # 1) Try to find a CallSign value (case-insensitive)
     cs_match = re.search(r'CallSign\s*:\s*([^,)\n]+)', line, flags=re.IGNORECASE)
     if cs_match:
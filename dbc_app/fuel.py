@@ -1,6 +1,21 @@
 import database
-import math
+import os
 import re
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Optional
+import numpy as np
+import pandas as pd
+import geo
+import track_parser
+from spatial_index import SpatialIndex
+
+# Shortest refuel routes checked for feasibility before falling back to the nearest tanker
+TANKER_TOP_K = int(os.getenv("FUEL_TANKER_TOP_K", "5"))
+
+# bc3_with_all_vw columns read for the asset itself and for tanker candidates
+ASSET_COLUMNS = ("fuel", "groundspeed")
+TANKER_COLUMNS = ("bc3_jtn", "bc3_vcs", "callsign", "latitude", "longitude")
 
 # -----------------------------
 # Aircraft fuel data (lbs/hour consumption, max fuel capacity in lbs)
@@ -66,6 +81,80 @@ REFUEL_SPEEDS = {
 }
 
 
+# -----------------------------
+# Compiled performance table
+# -----------------------------
+# AIRCRAFT_FUEL_DATA compiled once into one row per airframe. Raw aircraft_type strings
+# are canonicalized (upper case, punctuation and spaces dropped, then _ALIASES) so
+# "F-35A", "F35A" and "f 35a" all land on the same row; unknown types get the "NaN" row.
+UNKNOWN_AIRFRAME = "NaN"
+AIRCRAFT_CACHE_SIZE = int(os.getenv("AIRCRAFT_CACHE_SIZE", "256"))
+
+# Squashed spelling -> canonical airframe
+_ALIASES = {
+    "B2SPIR": "B2", "B2SPIRIT": "B2", "B2A": "B2",
+    "FA22": "F22", "F22A": "F22",
+    "FA18EF": "FA18E", "F18E": "FA18E", "F18F": "FA18F",
+    "F16CM": "F16C", "F16D": "F16C",
+    "F35": "F35A",
+    "B1": "B1B", "B52H": "B52",
+    "KC46A": "KC46", "KC135R": "KC135", "KC135T": "KC135",
+    "E3A": "E3", "E3B": "E3", "E3C": "E3", "E7A": "E7", "E2": "E2D",
+    "RC135V": "RC135VW", "RC135W": "RC135VW",
+    "P8A": "P8", "P3C": "P3", "U2S": "U2",
+    "MQ9A": "MQ9", "MQ9B": "MQ9", "RQ4A": "RQ4", "RQ4B": "RQ4",
+    "C17A": "C17", "C130H": "C130", "C130J": "C130", "MC130J": "MC130", "EC130H": "EC130",
+}
+_NULL_TYPES = {"", "NULL", "NONE", "NAN"}
+
+
+def canonical_type(raw) -> Optional[str]:
+    """'F-35A', 'F35A' and ' f 35a ' -> 'F35A'; None, NaN, '' and '[null]' -> None."""
+    if raw is None or (isinstance(raw, float) and raw != raw):
+        return None
+    key = re.sub(r"[^0-9A-Z]", "", str(raw).upper())
+    if key in _NULL_TYPES:
+        return None
+    return _ALIASES.get(key, key)
+
+
+def _compile(data):
+    names, rows = [], {}
+    for raw, perf in data.items():
+        name = UNKNOWN_AIRFRAME if raw == UNKNOWN_AIRFRAME else canonical_type(raw)
+        if name not in rows:  # aliases of one airframe share a row
+            rows[name] = len(names)
+            names.append((name, perf))
+    ids = {name: i for i, (name, _) in enumerate(names)}
+    columns = {
+        field: np.array([perf[field] for _, perf in names], dtype=float)
+        for field in ("consumption_rate", "max_fuel_capacity", "cruise_speed")
+    }
+    return ids, columns
+
+
+AIRFRAME_IDS, PERFORMANCE = _compile(AIRCRAFT_FUEL_DATA)   # name -> id, field -> array by id
+UNKNOWN_ID = AIRFRAME_IDS[UNKNOWN_AIRFRAME]
+
+
+@lru_cache(maxsize=AIRCRAFT_CACHE_SIZE)
+def airframe_id(raw) -> int:
+    """Row of PERFORMANCE for a raw aircraft_type, UNKNOWN_ID when it is not in the table."""
+    return AIRFRAME_IDS.get(canonical_type(raw), UNKNOWN_ID)
+
+
+# Read-only {"consumption_rate", "max_fuel_capacity", "cruise_speed"} view of each row
+_PROFILES = tuple(
+    MappingProxyType({field: float(values[i]) for field, values in PERFORMANCE.items()})
+    for i in range(len(AIRFRAME_IDS))
+)
+
+
+def aircraft_profile(raw):
+    """Performance profile for a raw aircraft_type (the shared read-only row, not a copy)."""
+    return _PROFILES[airframe_id(raw)]
+
+
 # -----------------------------
 # Utility Functions
 # -----------------------------
@@ -89,202 +178,171 @@ def get_consumption_rate_mps(speed_mps, aircraft_data):
     return rate
 
 
-def midpoint_to_tanker(tank_lat, tank_long, asset_lat, asset_long):
-    """
-    Calculate the midpoint between a tanker and an asset
-    """
-    midpoint_lat = (tank_lat + asset_lat) / 2
-    midpoint_long = (tank_long + asset_long) / 2
-
-    return midpoint_lat, midpoint_long
-
-def midpoint_for_target(calc, target, asset_lat, asset_long):
-    """
-    Calculate the distance between asset and target from a tanker midpoint
-    """
-    entity_lat = float(target["Latitude"])
-    entity_long = float(target["Longitude"])
-    distance_to_target = haversine(entity_lat, entity_long, calc[0],calc[1])
-    distance_to_origin = haversine(asset_lat, asset_long, calc[0],calc[1])
+def _tanker_positions(tankers):
+    """(index, positions of the tankers with a usable lat/lon) for a SpatialIndex or list of dicts."""
+    if not isinstance(tankers, SpatialIndex):
+        tankers = SpatialIndex.from_records(tankers)
+    valid = np.flatnonzero(~(np.isnan(tankers.lats) | np.isnan(tankers.lons)))
+    return tankers, valid
 
-    return distance_to_target, distance_to_origin
-    
 
-def haversine(lat1, lon1, lat2, lon2):
+def _route_matrix(asset_lats, asset_lons, distances, lats, lons, target):
     """
-    Calculate the great-circle distance between two points on the Earth in km.
+    (to_tanker, route) arrays of shape (assets, tankers): asset -> tanker, and
+    asset -> rendezvous -> target -> asset with the rendezvous halfway to the tanker.
     """
-    R = 6371  # Earth radius in km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+    a_lat = np.asarray(asset_lats, dtype=float)[:, None]
+    a_lon = np.asarray(asset_lons, dtype=float)[:, None]
+    to_tanker = geo.haversine_np(a_lat, a_lon, lats, lons)
+    mid_lat, mid_lon = (lats + a_lat) / 2, (lons + a_lon) / 2
+    route = (geo.haversine_np(a_lat, a_lon, mid_lat, mid_lon)
+             + geo.haversine_np(target.latitude, target.longitude, mid_lat, mid_lon)
+             + np.asarray(distances, dtype=float)[:, None])
+    return to_tanker, route
+
+
+def _candidates(to_tanker, route, k):
+    """(mask, nearest): per asset the k shortest routes plus the nearest tanker, and that tanker."""
+    n_tankers = route.shape[1]
+    k = max(1, min(k, n_tankers))
+    if k < n_tankers:
+        mask = np.zeros(route.shape, dtype=bool)
+        np.put_along_axis(mask, np.argpartition(route, k - 1, axis=1)[:, :k], True, axis=1)
+    else:
+        mask = np.ones(route.shape, dtype=bool)
+    nearest = np.argmin(to_tanker, axis=1)
+    mask[np.arange(len(mask)), nearest] = True
+    return mask, nearest
 
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
 
+def _asset_views(assets, snapshot=None):
+    """str(bc3_jtn) -> that asset's fuel/groundspeed rows, from the snapshot or one query."""
+    jtns = list(dict.fromkeys(asset["bc3_jtn"] for asset in assets if asset["bc3_jtn"] is not None))
+    if snapshot is not None:
+        return {str(jtn): snapshot.track_by_jtn(jtn) for jtn in jtns}
+    rows = database.query_friendly_assets(jtns, columns=("bc3_jtn",) + ASSET_COLUMNS)
+    if rows.empty or "bc3_jtn" not in rows.columns:
+        return {}
+    return {str(jtn): group.drop(columns="bc3_jtn").reset_index(drop=True)
+            for jtn, group in rows.groupby(rows["bc3_jtn"].astype(str), sort=False)}
 
 
-def find_nearest_tanker(friendly_lat, friendly_lon, tankers, target):
+def _fuel_inputs(friendly, all_view):
     """
-    Returns the closest tanker and distance to it.
-    tankers : list of dicts with keys "latitude" and "longitude"
+    (distance, current_fuel, consumption_rate, groundspeed, max_fuel) of one asset.
+    all_view holds the asset's bc3_with_all_vw rows (fuel, groundspeed) or is None.
     """
-    nearest = None
-    min_distance = float("inf")
-    entity_lat = float(target["Latitude"])
-    entity_long = float(target["Longitude"])
-
-    for tanker in tankers:
-        tanker_lat = float(tanker["latitude"])
-        tanker_lon = float(tanker["longitude"])
-        distance = haversine(friendly_lat, friendly_lon, tanker_lat, tanker_lon)
-        target_distance = haversine(entity_lat, entity_long, tanker_lat, tanker_lon)
-        if distance < min_distance:
-            min_distance = distance
-            nearest = tanker
-            tanker_to_target = target_distance
-
-    return nearest, min_distance,tanker_to_target
-
-def parse_track_info(track_string):
-    """
-    Regex to capture the main ID and all key-value pairs inside parentheses
-    """
-    match = re.match(r"(\d+)\s*\((.*)\)", track_string)
-    if not match:
-        return None
-       
-    track_id = match.group(1)
-    key_values = match.group(2)
- 
-    # Convert key-value pairs to a dictionary
-    info_dict = {}
-    for kv in key_values.split(","):
-        key, value = kv.split(":", 1)
-        info_dict[key.strip()] = value.strip()
-       
-    # Include the main ID as well
-    info_dict["ID"] = track_id
-    return info_dict
-
-
-# -----------------------------
-# Main Code
-# -----------------------------
-def analyze_fuel(friendly, target):
-    """
-    Determines if an asset can reach its target and return.
-    Returns:
-        3: Can make round trip with current fuel
-        2: Cannot with current fuel, but max fuel allows it
-        1: Cannot make round trip even at max fuel
-    """
-    # Asset Identification
-    # -----------------------------
-    track_id = friendly["bc3_jtn"]
     distance = float(friendly["distance_km"])
-    asset_lat = float(friendly["lat"])
-    asset_long = float(friendly["lon"])
-    all_view = database.query_friendly_asset(track_id)
-    speed = all_view["groundspeed"]
-    try:
-        if speed[0] == '0':
-            speed = 220
-    except:
-        speed = 220
-    tankers = database.query_tankers()
-
-    
-    
-    # Aircraft Data
-    # -----------------------------
-
-    
-    
-    if all_view.empty or "fuel" not in all_view.columns or "groundspeed" not in all_view.columns:
+    if all_view is None or all_view.empty or "fuel" not in all_view.columns or "groundspeed" not in all_view.columns:
         current_fuel = 20000
         speed = 220
-    
-    try:
-        if all_view.loc[0, "fuel"] is None:
-            current_fuel = 20000
-        else:
-            current_fuel = float(all_view.loc[0, "fuel"])
-
-    except:
-        current_fuel = 20000
-
-    if friendly["aircraft_type"] == None or "[null]":
-        aircraft_type = "NaN"
     else:
-        aircraft_type = friendly["aircraft_type"].upper()
-
-    if aircraft_type not in AIRCRAFT_FUEL_DATA or aircraft_type == None:
-        aircraft_type = "NaN"  # Unknown aircraft, assume worst case
-
-
-    cruisespeed = AIRCRAFT_FUEL_DATA[aircraft_type]["cruise_speed"]
-    groundspeed = cruisespeed * 3.6
-    aircraft_rate = AIRCRAFT_FUEL_DATA[aircraft_type]["consumption_rate"] # Redundant, only use as backup
-    aircraft_max = AIRCRAFT_FUEL_DATA[aircraft_type]["max_fuel_capacity"]
-
-    # Trip Functions
-    # -----------------------------
-    def can_make_round_trip(F, R, D, V):
-        time_required = (2 * D) / V
-        fuel_needed = R * time_required
-
-        return F >= fuel_needed
-    def can_make_tanker_trip(F, R, D, V):
-        time_required = D / V
-        fuel_needed = R * time_required
-        return F >= fuel_needed
-
-    def build_report(score, tanker):
-
-        return_report = {
-            "score": score,
-            "tanker_jtn": tanker["bc3_jtn"],
-            "tanker_vcs": tanker["bc3_vcs"],
-            "tanker_callsign": tanker["callsign"]
-        }
-        return return_report
+        speed = all_view["groundspeed"]
+        try:
+            if speed[0] == '0':
+                speed = 220
+        except:
+            speed = 220
+        try:
+            # NULL reads as None alone but as NaN when batched with other rows
+            if pd.isna(all_view.loc[0, "fuel"]):
+                current_fuel = 20000
+            else:
+                current_fuel = float(all_view.loc[0, "fuel"])
+        except:
+            current_fuel = 20000
 
-# -----------------------------
-# Logic calls for variable consumption rate, data for the nearest fuel tankers, and distance to target calculations
-# -----------------------------
-    aircraft_consumption_rate = get_consumption_rate_mps(speed, AIRCRAFT_FUEL_DATA[aircraft_type])
-    #print(aircraft_consumption_rate)
-    nearest_tanker, distance_to_tanker, target_distance = find_nearest_tanker(asset_lat, asset_long, tankers, parse_track_info(target))
-    midpoint_calc = midpoint_to_tanker(nearest_tanker["latitude"], nearest_tanker["longitude"], asset_lat, asset_long)
-    distance_to_target, distance_to_origin = midpoint_for_target(midpoint_calc, parse_track_info(target), asset_lat, asset_long)
-
-    # if isinstance(aircraft_consumption_rate, list) and consumption_rate:
-    #     print("WOR")
-    #     aircraft_consumption_rate = float(aircraft_consumption_rate[0])
-    # print(aircraft_consumption_rate)
-    # print(type(aircraft_consumption_rate))
+    aircraft = aircraft_profile(friendly["aircraft_type"])  # worst case "NaN" profile when unknown
+    groundspeed = aircraft["cruise_speed"] * 3.6
+    aircraft_max = aircraft["max_fuel_capacity"]
 
+    # Variable consumption rate from the actual speed; the base rate is only a backup
+    aircraft_consumption_rate = get_consumption_rate_mps(speed, aircraft)
     try:
         aircraft_consumption_rate = float(aircraft_consumption_rate[0])
     except:
         aircraft_consumption_rate = float(aircraft_consumption_rate)
 
-    #print(f"rate: {aircraft_consumption_rate}")
+    return distance, current_fuel, aircraft_consumption_rate, groundspeed, aircraft_max
 
-    if can_make_round_trip(current_fuel, aircraft_consumption_rate, distance, groundspeed):
-            return 4  # Can make it with current fuel
-    elif can_make_round_trip(current_fuel, aircraft_consumption_rate, distance_to_tanker, groundspeed):
-            # Can make it to the tanker
-            if can_make_tanker_trip(aircraft_max, aircraft_consumption_rate, (distance_to_target + distance + distance_to_origin), groundspeed):
-                return build_report(3, nearest_tanker["bc3_vcs"], nearest_tanker["bc3_jtn"]) (distance_to_target + distance + distance_to_origin)  # Needs refuel, but max fuel allows it, considers new target distance
-            else:
-                return build_report(2, nearest_tanker), "Cannot reach target after refuel" # Cannot make round trip even at max fuel       
-    else:
-            return build_report(2, nearest_tanker), "Cannot make round trip"  # Cannot make round trip even at max fuel
+
+def build_report(score, tanker, route_km=None):
+    return_report = {
+        "score": score,
+        "tanker_jtn": tanker["bc3_jtn"],
+        "tanker_vcs": tanker["bc3_vcs"],
+        "tanker_callsign": tanker["callsign"]
+    }
+    if route_km is not None:
+        return_report["route_km"] = route_km
+    return return_report
+
+# -----------------------------
+# Main Code
+# -----------------------------
+def analyze_fuel(friendly, target, snapshot=None):
+    """
+    Determines if an asset can reach its target and return.
+    Returns:
+        4: Can make round trip with current fuel
+        3: Needs a tanker, and max fuel after refueling covers the route (report dict)
+        2: Cannot make it even with the nearest tanker (report dict, reason)
+        1: Needs a tanker but none is available
+    """
+    return analyze_fuel_batch([friendly], target, snapshot)[0]
 
 
-        
-        
\ No newline at end of file
+def analyze_fuel_batch(assets, target, snapshot=None, tankers=None):
+    """
+    analyze_fuel for several assets against one target. Fuel and groundspeed of every
+    asset come from one query, tankers are loaded once (and only if some asset needs
+    one), and the round-trip and tanker checks run as array math over assets x tankers.
+    Pass `tankers` (SpatialIndex or list of rows) when the caller already has them.
+    Returns each asset's analyze_fuel result, in order.
+    """
+    assets = list(assets)
+    if not assets:
+        return []
+
+    views = _asset_views(assets, snapshot)
+    inputs = [_fuel_inputs(asset, views.get(str(asset["bc3_jtn"]))) for asset in assets]
+    distance, current_fuel, rate, groundspeed, aircraft_max = (np.array(col, dtype=float) for col in zip(*inputs))
+
+    # Same arithmetic as F >= R * (2 * D / V) per asset
+    direct = current_fuel >= rate * ((2 * distance) / groundspeed)
+    results = [4 if ok else None for ok in direct]  # 4: Can make it with current fuel
+    if direct.all():
+        return results
+
+    # Tankers are only needed once an asset cannot make the trip on its own
+    if tankers is None:
+        tankers = snapshot.role_index("tankers") if snapshot is not None else database.query_tankers(columns=TANKER_COLUMNS)
+    tankers, valid = _tanker_positions(tankers)
+    if valid.size == 0:
+        return [result if result is not None else (1, "No tankers available") for result in results]
+
+    need = np.flatnonzero(~direct)
+    target_track = track_parser.parse_target(target)
+    lats = np.array([float(assets[i]["lat"]) for i in need])
+    lons = np.array([float(assets[i]["lon"]) for i in need])
+    to_tanker, route = _route_matrix(lats, lons, distance[need], tankers.lats[valid], tankers.lons[valid], target_track)
+    mask, nearest = _candidates(to_tanker, route, TANKER_TOP_K)
+
+    col = lambda values: values[need][:, None]
+    reach = col(current_fuel) >= col(rate) * ((2 * to_tanker) / col(groundspeed))
+    finish = col(aircraft_max) >= col(rate) * (route / col(groundspeed))
+    # Shortest feasible route among each asset's candidates; argmin keeps the lowest position on ties
+    feasible_route = np.where(mask & reach & finish, route, np.inf)
+    best = feasible_route.argmin(axis=1)
+
+    for row, i in enumerate(need):
+        if np.isfinite(feasible_route[row, best[row]]):
+            tanker = tankers.record(int(valid[best[row]]))
+            results[i] = build_report(3, tanker, float(route[row, best[row]]))  # Needs refuel, but max fuel allows it
+            continue
+        nearest_tanker = tankers.record(int(valid[nearest[row]]))
+        if reach[row, nearest[row]]:
+            results[i] = build_report(2, nearest_tanker), "Cannot reach target after refuel"
+        else:
+            results[i] = build_report(2, nearest_tanker), "Cannot make round trip"
+    return results
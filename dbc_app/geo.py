@@ -0,0 +1,73 @@
+"""
+geo.py
+---------
+Great-circle distance helpers shared by the evaluation modules.
+
+- `haversine` works on scalars.
+- `haversine_np` is the same formula over NumPy arrays, so one call measures a point
+  against every track in the picture.
+- `bounding_box` turns a radius search into lat/lon ranges a SQL WHERE clause can use.
+"""
+
+import math
+import numpy as np
+
+EARTH_RADIUS_KM = 6371
+KM_PER_DEG = EARTH_RADIUS_KM * math.pi / 180
+_BOX_MARGIN_DEG = 1e-6  # keeps points on the circle inside the box despite rounding
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """
+    Calculate the great-circle distance between two points on the Earth in km.
+    """
+    phi1 = math.radians(lat1)
+    phi2 = math.radians(lat2)
+    delta_phi = math.radians(lat2 - lat1)
+    delta_lambda = math.radians(lon2 - lon1)
+
+    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
+    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_np(lat1, lon1, lat2, lon2):
+    """
+    Vectorized haversine in km. Arguments broadcast against each other, e.g. a scalar
+    point against arrays of track coordinates. NaN coordinates give NaN distances.
+    """
+    phi1 = np.radians(lat1)
+    phi2 = np.radians(lat2)
+    delta_phi = phi2 - phi1
+    delta_lambda = np.radians(np.asarray(lon2, dtype=float) - np.asarray(lon1, dtype=float))
+
+    a = np.sin(delta_phi/2)**2 + np.cos(phi1) * np.cos(phi2) * np.sin(delta_lambda/2)**2
+    a = np.clip(a, 0.0, 1.0)  # rounding can push antipodal points just past 1
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+    return EARTH_RADIUS_KM * c
+
+
+def bounding_box(lat, lon, km):
+    """
+    Lat/lon boxes holding every point within `km` of (lat, lon).
+    Returns a list of (lat_min, lat_max, lon_min, lon_max): one box, or two when the circle
+    crosses the antimeridian. Returns None when the circle covers the whole globe.
+    Points in a box still need an exact haversine check.
+    """
+    if km >= math.pi * EARTH_RADIUS_KM:
+        return None
+    dlat = km / KM_PER_DEG + _BOX_MARGIN_DEG
+    lat_min, lat_max = lat - dlat, lat + dlat
+    if lat_min <= -90 or lat_max >= 90:
+        # The circle contains a pole, so it spans every longitude
+        return [(max(lat_min, -90.0), min(lat_max, 90.0), -180.0, 180.0)]
+
+    # Widest longitude reach of a spherical cap that does not contain a pole
+    ratio = math.sin(km / EARTH_RADIUS_KM) / math.cos(math.radians(lat))
+    dlon = math.degrees(math.asin(min(ratio, 1.0))) + _BOX_MARGIN_DEG
+    lon_min, lon_max = lon - dlon, lon + dlon
+    if lon_min < -180:
+        return [(lat_min, lat_max, lon_min + 360, 180.0), (lat_min, lat_max, -180.0, lon_max)]
+    if lon_max > 180:
+        return [(lat_min, lat_max, lon_min, 180.0), (lat_min, lat_max, -180.0, lon_max - 360)]
+    return [(lat_min, lat_max, lon_min, lon_max)]
@@ -1,7 +1,10 @@
-from geopy.distance import geodesic
 import database     
-import re
+import geo
+import track_parser
+from spatial_index import SpatialIndex
 
+# bc3_with_all_vw columns locate_hostiles reads
+HOSTILE_COLUMNS = ("tracknumber", "trackid", "trackcategory", "latitude", "longitude")
 
 
 #target = "44875 (CallSign: None, Track Cat: Air, Track ID: Hostile, Aircraft Type: None, Lattitude: 23.940473666159686, Longitude: -78.38917303598667)"
@@ -12,53 +15,41 @@ import re
 #     if distance < 6000 and row.entitytrackid == "hostile":
 #         detected.append(row)  # append the whole row
 
-def evaluate_threat(friendly, target):
+def evaluate_threat(friendly, target, snapshot=None):
     
     friendly = friendly
     target = target
     
-    def parse_track_info(track_string):
-        # Regex to capture the main ID and all key-value pairs inside parentheses
-        match = re.match(r"(\d+)\s*\((.*)\)", track_string)
-        if not match:
-            return None
-        
-        track_id = match.group(1)
-        key_values = match.group(2)
-
-        # Convert key-value pairs to a dictionary
-        info_dict = {}
-        for kv in key_values.split(","):
-            key, value = kv.split(":", 1)
-            info_dict[key.strip()] = value.strip()
-        
-        # Include the main ID as well
-        info_dict["ID"] = track_id
-        return info_dict
-    
-    hostile = parse_track_info(target)
+    hostile = track_parser.parse_target(target)
     
     def compute_midPoint(friendly, target):  
         return [
-            (float(friendly["lat"]) + float(target["Latitude"])) / 2,
-            (float(friendly["lon"]) + float(target["Longitude"])) / 2
+            (float(friendly["lat"]) + target.latitude) / 2,
+            (float(friendly["lon"]) + target.longitude) / 2
         ]
     
     midpoint = compute_midPoint(friendly,hostile)
     
     def determine_radius(friendly,target ):
-        return geodesic([friendly["lat"],friendly["lon"]], [target["Latitude"], target["Longitude"]]).km / 2
+        return geo.haversine(float(friendly["lat"]), float(friendly["lon"]), target.latitude, target.longitude) / 2
     
     radius = determine_radius(friendly,hostile)
 
     def locate_hostiles(midpoint, radius):
-        bc3_all = database.query_bc3_with_all_vw()
-        detected = []
-        for row in bc3_all.itertuples(index=False):
-            distance = geodesic(midpoint, [float(row.latitude), float(row.longitude)]).km
-            if distance < radius and row.trackid in ("Hostile"):
-                detected.append((row.tracknumber, row.trackid, row.trackcategory ))  # append the whole row
-        return detected
+        if snapshot is not None:
+            bc3_all, index = snapshot.tracks, snapshot.track_index
+        else:
+            # No snapshot (app.main always has one): let the database drop everything
+            # outside the circle's bounding box
+            boxes = geo.bounding_box(midpoint[0], midpoint[1], radius)
+            bc3_all = database.query_bc3_in_box(boxes, trackid="Hostile", columns=HOSTILE_COLUMNS)
+            index = SpatialIndex.from_frame(bc3_all)
+        if bc3_all.empty:
+            return []
+        # Only the grid cells around the midpoint are measured; hits come back in view order
+        hits = index.within_radius(midpoint[0], midpoint[1], radius, filter={"trackid": "Hostile"})
+        rows = bc3_all.iloc[[hit.position for hit in hits]][["tracknumber", "trackid", "trackcategory"]]
+        return list(rows.itertuples(index=False, name=None))
     
     detected_hotiles = locate_hostiles(midpoint, radius)
 
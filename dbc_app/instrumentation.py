@@ -0,0 +1,206 @@
+"""
+instrumentation.py
+---------
+Stage and query timing for the evaluation pipeline.
+
+Purpose:
+- `with stage("fuel"):` records wall time plus the database round trips, rows and bytes
+  fetched inside one pipeline stage.
+- `@query` does the same for each database.* function it wraps.
+- Keep the last DBC_INSTRUMENT_WINDOW samples per stage/query and emit p50/p95/p99 of each
+  metric as JSON log lines (stdout, or DBC_INSTRUMENT_LOG when set).
+- With DBC_PROFILE=1 the first cycle runs under cProfile and its stats are dumped to
+  DBC_PROFILE_PATH (read them with `python -m pstats`).
+
+Counters are per thread, so stages evaluated concurrently by app.evaluate_friendlies do
+not see each other's queries. Bytes are the decoded size of the result in memory, not
+wire bytes, which psycopg2 does not expose.
+"""
+
+import cProfile
+import functools
+import json
+import os
+import sys
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+import pandas as pd
+
+ENABLED = os.getenv("DBC_INSTRUMENT", "1") not in ("0", "false", "False", "")
+WINDOW = int(os.getenv("DBC_INSTRUMENT_WINDOW", "500"))          # samples kept per stage/query
+EMIT_EVERY = int(os.getenv("DBC_INSTRUMENT_EMIT_EVERY", "1"))    # cycles between summaries
+LOG_PATH = os.getenv("DBC_INSTRUMENT_LOG")                        # JSON lines file; stdout when unset
+PROFILE = os.getenv("DBC_PROFILE", "0") not in ("0", "false", "False", "")
+PROFILE_PATH = os.getenv("DBC_PROFILE_PATH", "dbc_cycle.prof")
+
+PERCENTILES = (50, 95, 99)
+METRICS = ("seconds", "round_trips", "rows", "bytes")
+
+_local = threading.local()
+_lock = threading.Lock()
+_samples = defaultdict(lambda: deque(maxlen=WINDOW))  # "stage:fuel" -> (seconds, round_trips, rows, bytes)
+_listeners = []
+_cycles = 0
+_profiled = False
+
+
+def _frames():
+    """Counters of every stage/query open on this thread, outermost first."""
+    frames = getattr(_local, "frames", None)
+    if frames is None:
+        frames = _local.frames = []
+    return frames
+
+
+def round_trip():
+    """Count one statement sent to the database (called by database.CountingCursor)."""
+    if ENABLED:
+        for frame in _frames():
+            frame[0] += 1
+
+
+def result_size(result):
+    """(rows, bytes) of a query result: a DataFrame or a list of rows; anything else is (0, 0)."""
+    if isinstance(result, pd.DataFrame):
+        return len(result), int(result.memory_usage(index=False, deep=True).sum())
+    if isinstance(result, (list, tuple)):
+        size = 0
+        for row in result:
+            values = row.values() if isinstance(row, dict) else row
+            size += sum(sys.getsizeof(value) for value in values)
+        return len(result), size
+    return 0, 0
+
+
+def add_listener(fn):
+    """Call fn(key, seconds, round_trips, rows, nbytes) for every sample recorded from now on."""
+    _listeners.append(fn)
+
+
+def record(key, seconds, round_trips=0, rows=0, nbytes=0):
+    with _lock:
+        _samples[key].append((seconds, round_trips, rows, nbytes))
+    for listener in _listeners:
+        listener(key, seconds, round_trips, rows, nbytes)
+
+
+@contextmanager
+def _measure(key):
+    frames = _frames()
+    frame = [0, 0, 0]  # round trips, rows, bytes
+    frames.append(frame)
+    start = time.perf_counter()
+    try:
+        yield frame
+    finally:
+        seconds = time.perf_counter() - start
+        frames.pop()
+        # Rows/bytes fetched inside count towards the enclosing stage (and, when that
+        # closes, towards its own parent); round trips already reached every open frame
+        if frames:
+            frames[-1][1] += frame[1]
+            frames[-1][2] += frame[2]
+        record(key, seconds, *frame)
+
+
+@contextmanager
+def stage(name):
+    """Time one pipeline stage, e.g. `with stage("hostiles"): ...`."""
+    if not ENABLED:
+        yield
+        return
+    with _measure(f"stage:{name}"):
+        yield
+
+
+def query(fn):
+    """Decorator for database.* functions: time, round trips, rows and bytes per call."""
+    key = f"query:{fn.__name__}"
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        if not ENABLED:
+            return fn(*args, **kwargs)
+        with _measure(key) as frame:
+            result = fn(*args, **kwargs)
+            rows, nbytes = result_size(result)
+            frame[1] += rows
+            frame[2] += nbytes
+        return result
+    return wrapper
+
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list."""
+    rank = max(1, -(-len(ordered) * pct // 100))
+    return ordered[int(rank) - 1]
+
+
+def summary() -> dict:
+    """key -> {"count": n, metric: {"p50": .., "p95": .., "p99": ..}} over the rolling window."""
+    with _lock:
+        snapshot = {key: list(samples) for key, samples in _samples.items() if samples}
+    out = {}
+    for key, samples in sorted(snapshot.items()):
+        entry = {"count": len(samples)}
+        for i, metric in enumerate(METRICS):
+            ordered = sorted(sample[i] for sample in samples)
+            entry[metric] = {f"p{pct}": _percentile(ordered, pct) for pct in PERCENTILES}
+        out[key] = entry
+    return out
+
+
+def emit():
+    """Write the current summary as one JSON line per stage/query."""
+    logged_at = datetime.now(timezone.utc).isoformat()
+    lines = []
+    for key, entry in summary().items():
+        kind, name = key.split(":", 1)
+        lines.append(json.dumps({"event": "dbc.timing", "ts": logged_at, "kind": kind, "name": name, **entry}))
+    if not lines:
+        return
+    if LOG_PATH:
+        try:
+            with open(LOG_PATH, "a") as f:
+                f.write("\n".join(lines) + "\n")
+        except OSError as e:
+            print("Error writing instrumentation log:", e)
+    else:
+        for line in lines:
+            print(line)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+
+
+def run_cycle(fn, *args, **kwargs):
+    """
+    Run one app.main() cycle as the "cycle" stage and emit a summary every EMIT_EVERY
+    cycles. With DBC_PROFILE set the first cycle runs under cProfile; only the calling
+    thread is profiled, so use DBC_EVAL_WORKERS=1 to see inside the evaluation stages.
+    """
+    global _cycles, _profiled
+    if PROFILE and not _profiled:
+        _profiled = True
+        profiler = cProfile.Profile()
+        with stage("cycle"):
+            result = profiler.runcall(fn, *args, **kwargs)
+        try:
+            profiler.dump_stats(PROFILE_PATH)
+            print(f"Cycle profile written to {PROFILE_PATH}")
+        except OSError as e:
+            print("Error writing profile:", e)
+    else:
+        with stage("cycle"):
+            result = fn(*args, **kwargs)
+
+    _cycles += 1
+    if ENABLED and EMIT_EVERY > 0 and _cycles % EMIT_EVERY == 0:
+        emit()
+    return result
@@ -0,0 +1,116 @@
+"""
+listener.py
+---------
+Decides how long the app.py loop sleeps between cycles.
+
+Purpose:
+- Wake the loop as soon as Postgres NOTIFYs new rows in `user_input` (and, in queue mode,
+  `mef_data_testing`; see database.install_notify_triggers), but never sooner than
+  POLL_MIN after the previous wake-up.
+- Fall back to polling with an adaptive backoff when notifications are unavailable:
+  poll quickly right after work arrives, back off towards POLL_MAX while idle.
+- Keep trying to re-establish LISTEN while polling.
+"""
+
+import os
+import select
+import time
+
+import database
+
+NOTIFY_ENABLED = os.getenv("DBC_NOTIFY", "1") not in ("0", "false", "False", "")
+NOTIFY_TIMEOUT = float(os.getenv("DBC_NOTIFY_TIMEOUT", "60"))  # safety sweep even without notifications
+POLL_MIN = float(os.getenv("DBC_POLL_MIN", "1"))
+POLL_MAX = float(os.getenv("DBC_POLL_MAX", "30"))
+LISTEN_RETRY = float(os.getenv("DBC_LISTEN_RETRY", "60"))
+
+
+class WorkWaiter:
+    """Block until there may be new work for app.main()."""
+
+    def __init__(self, use_notify=NOTIFY_ENABLED, channel=database.NOTIFY_CHANNEL,
+                 notify_timeout=NOTIFY_TIMEOUT, poll_min=POLL_MIN, poll_max=POLL_MAX,
+                 listen_retry=LISTEN_RETRY):
+        self.use_notify = use_notify
+        self.channel = channel
+        self.notify_timeout = notify_timeout
+        self.poll_min = poll_min
+        self.poll_max = poll_max
+        self.listen_retry = listen_retry
+        self.delay = poll_min
+        self.tables = set(database.notify_tables())
+        self._conn = None
+        self._triggers_ready = False
+        self._next_listen_attempt = 0.0
+        if use_notify:
+            self._start_listening()
+
+    @property
+    def listening(self) -> bool:
+        return self._conn is not None
+
+    def _start_listening(self):
+        self._next_listen_attempt = time.monotonic() + self.listen_retry
+        if not self._triggers_ready:
+            self._triggers_ready = database.install_notify_triggers()
+            if not self._triggers_ready:
+                print("Notify triggers not installed (set DB_NOTIFY_INSTALL=1 to create them), polling instead")
+                return
+        try:
+            self._conn = database.open_listen_connection(self.channel)
+            print(f"Listening on channel '{self.channel}'")
+        except Exception as e:
+            print("Error opening LISTEN connection, polling instead:", e)
+            self._conn = None
+
+    def _drop_listener(self):
+        try:
+            self._conn.close()
+        except Exception:
+            pass
+        self._conn = None
+
+    def _wait_notify(self) -> bool:
+        """
+        Wait for a notification from one of self.tables (or the safety timeout). Others,
+        e.g. the app's own MEF inserts from a trigger left on mef_data, are skipped.
+        False if the connection died.
+        """
+        deadline = time.monotonic() + self.notify_timeout
+        try:
+            while True:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return True
+                ready, _, _ = select.select([self._conn], [], [], remaining)
+                if not ready:
+                    return True
+                self._conn.poll()
+                # Coalesce a burst of inserts into a single wake-up
+                relevant = any(notify.payload in self.tables for notify in self._conn.notifies)
+                self._conn.notifies.clear()
+                if relevant:
+                    return True
+        except Exception as e:
+            print("LISTEN connection lost, polling instead:", e)
+            self._drop_listener()
+            return False
+
+    def _sleep_poll(self, did_work: bool):
+        # Adaptive backoff: reset after useful work, double while idle
+        self.delay = self.poll_min if did_work else min(self.delay * 2, self.poll_max)
+        time.sleep(self.delay)
+
+    def wait(self, did_work: bool):
+        started = time.monotonic()
+        if self.use_notify and not self.listening and time.monotonic() >= self._next_listen_attempt:
+            self._start_listening()
+        if self.listening and self._wait_notify():
+            # At least poll_min between cycles, however fast notifications arrive
+            time.sleep(max(0.0, self.poll_min - (time.monotonic() - started)))
+            return
+        self._sleep_poll(did_work)
+
+    def close(self):
+        if self.listening:
+            self._drop_listener()
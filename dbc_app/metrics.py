@@ -0,0 +1,220 @@
+"""
+metrics.py
+---------
+Prometheus metrics and a health check on port 8070, the port the Dockerfile exposes.
+
+Purpose:
+- Serve GET /metrics (Prometheus text format) and GET /healthz from a stdlib
+  ThreadingHTTPServer on a daemon thread next to the app.py loop.
+- Report cycles run, COAs written, friendly evaluations that failed, per-stage and
+  per-query latency histograms fed by instrumentation, connection pool use, catalog and track parser cache
+  hits, and in queue mode the number of MEFs still waiting to be claimed.
+- /healthz answers 503 once no cycle has finished for DBC_HEALTH_MAX_AGE seconds.
+
+Latency histograms need instrumentation enabled (DBC_INSTRUMENT, on by default).
+"""
+
+import json
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import database
+import instrumentation
+import track_parser
+
+ENABLED = os.getenv("DBC_METRICS", "1") not in ("0", "false", "False", "")
+HOST = os.getenv("DBC_METRICS_HOST", "0.0.0.0")
+PORT = int(os.getenv("DBC_METRICS_PORT", "8070"))
+HEALTH_MAX_AGE = float(os.getenv("DBC_HEALTH_MAX_AGE", "300"))  # seconds without a finished cycle
+
+# Latency buckets in seconds, shared by the stage and query histograms
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Histogram:
+    """Cumulative Prometheus histogram over BUCKETS."""
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.count += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+    def copy(self):
+        clone = Histogram(self.buckets)
+        clone.counts = list(self.counts)
+        clone.count = self.count
+        clone.sum = self.sum
+        return clone
+
+
+_lock = threading.Lock()
+_started = time.time()
+_last_cycle = None  # wall-clock time the last cycle finished
+_counters = {"cycles": 0, "cycles_with_work": 0, "coas": 0, "friendlies_failed": 0}
+_histograms = {"stage": {}, "query": {}}  # kind -> name -> Histogram
+
+
+def _observe(key, seconds, *_):
+    kind, name = key.split(":", 1)
+    if kind not in _histograms:
+        return
+    with _lock:
+        histogram = _histograms[kind].get(name)
+        if histogram is None:
+            histogram = _histograms[kind][name] = Histogram()
+        histogram.observe(seconds)
+
+
+instrumentation.add_listener(_observe)
+
+
+def cycle_finished(did_work):
+    global _last_cycle
+    with _lock:
+        _counters["cycles"] += 1
+        if did_work:
+            _counters["cycles_with_work"] += 1
+        _last_cycle = time.time()
+
+
+def coa_produced(count=1):
+    """Count COAs actually written to the COA table."""
+    with _lock:
+        _counters["coas"] += count
+
+
+def friendly_failed(count=1):
+    """Count friendly evaluations that raised (their MEF's COA goes out without them)."""
+    with _lock:
+        _counters["friendlies_failed"] += count
+
+
+def _label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric(lines, name, kind, help_text, samples):
+    """Append one metric family; samples are (label dict, value) pairs."""
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        if labels:
+            rendered = ",".join(f'{key}="{_label(val)}"' for key, val in labels.items())
+            lines.append(f"{name}{{{rendered}}} {value}")
+        else:
+            lines.append(f"{name} {value}")
+
+
+def _histogram(lines, name, help_text, label, histograms):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} histogram")
+    for key, histogram in sorted(histograms.items()):
+        key = _label(key)
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            lines.append(f'{name}_bucket{{{label}="{key}",le="{bound}"}} {count}')
+        lines.append(f'{name}_bucket{{{label}="{key}",le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{label}="{key}"}} {histogram.sum}')
+        lines.append(f'{name}_count{{{label}="{key}"}} {histogram.count}')
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    with _lock:
+        counters = dict(_counters)
+        last_cycle = _last_cycle
+        histograms = {
+            kind: {name: h.copy() for name, h in by_name.items()} for kind, by_name in _histograms.items()
+        }
+
+    lines = []
+    _metric(lines, "dbc_cycles_total", "counter", "app.main() cycles run.", [({}, counters["cycles"])])
+    _metric(lines, "dbc_cycles_with_work_total", "counter", "Cycles that evaluated at least one MEF.",
+            [({}, counters["cycles_with_work"])])
+    _metric(lines, "dbc_coas_total", "counter", "COAs written to the COA table.", [({}, counters["coas"])])
+    _metric(lines, "dbc_friendly_evaluations_failed_total", "counter", "Friendly evaluations that raised.",
+            [({}, counters["friendlies_failed"])])
+    _metric(lines, "dbc_last_cycle_age_seconds", "gauge", "Seconds since the last cycle finished.",
+            [({}, round(time.time() - (last_cycle or _started), 3))])
+    _histogram(lines, "dbc_stage_seconds", "Wall time per pipeline stage.", "stage", histograms["stage"])
+    _histogram(lines, "dbc_query_seconds", "Wall time per database query function.", "query", histograms["query"])
+
+    # Only report the pool once something has created it
+    pool = database._pool
+    if pool is not None:
+        stats = pool.stats()
+        _metric(lines, "dbc_db_pool_connections", "gauge", "Pooled database connections by state.",
+                [({"state": "in_use"}, stats["in_use"]), ({"state": "idle"}, stats["idle"])])
+        _metric(lines, "dbc_db_pool_max_connections", "gauge", "Pool size limit.", [({}, stats["max"])])
+
+    catalog = database.catalog_cache.stats()
+    parser = track_parser.cache_info()
+    _metric(lines, "dbc_cache_hits_total", "counter", "Cache hits.",
+            [({"cache": "catalog"}, catalog["hits"]), ({"cache": "track_parser"}, parser.hits)])
+    _metric(lines, "dbc_cache_misses_total", "counter", "Cache misses.",
+            [({"cache": "catalog"}, catalog["misses"]), ({"cache": "track_parser"}, parser.misses)])
+
+    if database.QUEUE_MODE:
+        depth = database.count_pending(database.mef_data)
+        if depth is not None:
+            _metric(lines, "dbc_mef_queue_depth", "gauge", "MEF rows waiting to be claimed.", [({}, depth)])
+
+    return "\n".join(lines) + "\n"
+
+
+def health():
+    """(healthy, details) for /healthz."""
+    with _lock:
+        last_cycle = _last_cycle
+        cycles = _counters["cycles"]
+    age = time.time() - (last_cycle or _started)
+    healthy = age <= HEALTH_MAX_AGE
+    return healthy, {"status": "ok" if healthy else "stale", "last_cycle_age_seconds": round(age, 3),
+                     "cycles": cycles}
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            self._send(200, "text/plain; version=0.0.4; charset=utf-8", render())
+        elif path == "/healthz":
+            healthy, details = health()
+            self._send(200 if healthy else 503, "application/json", json.dumps(details))
+        else:
+            self._send(404, "text/plain; charset=utf-8", "not found\n")
+
+    def _send(self, status, content_type, body):
+        payload = body.encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, format, *args):
+        pass  # scrapes would flood stdout
+
+
+def start(host=HOST, port=PORT):
+    """Serve /metrics and /healthz on a daemon thread. Returns the server, or None if disabled/failed."""
+    if not ENABLED:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        print(f"Metrics server not started on {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="dbc-metrics", daemon=True).start()
+    print(f"Metrics on http://{host}:{port}/metrics")
+    return server
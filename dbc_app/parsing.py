@@ -9,6 +9,7 @@ import psycopg2
 from psycopg2 import sql
 
 import database  # must expose DB_HOST/PORT/NAME/USER/PASS and your deliverable table names
+import track_parser
 
 DB = dict(
     host=database.DB_HOST,
@@ -48,6 +49,9 @@ _ENTITY_CAT_RE = re.compile(r"(?i)\btrack\s*cat\s*:\s*([^,;|\n\r]+)")
 def parse_entity_track_cat(entity_text):
     if not isinstance(entity_text, str):
         return None
+    track = track_parser.parse_target(entity_text)
+    if track is not None and track.track_cat:
+        return track.track_cat
     m = _ENTITY_CAT_RE.search(entity_text)
     return m.group(1).strip() if m else None
 
@@ -0,0 +1,99 @@
+"""
+probability.py
+---------
+Kill-probability math used by armament.py.
+
+With per-shot effectiveness p, n independent shots succeed with 1 - (1 - p)**n.
+Rather than stepping n = 1, 2, ... until that crosses a threshold, the required shot
+count comes straight from logarithms:
+
+    n = ceil( log((1 - threshold) / failure) / log(1 - p) )
+
+where `failure` is the miss probability already left by earlier weapons (1.0 for none).
+The `_np` variants take NumPy arrays so whole weapon lists or what-if sweeps over
+thresholds are evaluated in one call.
+"""
+
+import math
+import numpy as np
+
+# Smallest miss probability that still leaves 1 - miss distinguishable from 1.0 in floats.
+# A threshold of exactly 1.0 is "reached" once the miss probability rounds away below it.
+_MISS_FLOOR = 2.0 ** -54
+
+
+def cumulative(p: float, n) -> float:
+    """Probability that at least one of n shots succeeds."""
+    return 1 - (1 - p) ** n
+
+
+def shots_to_threshold(p: float, threshold: float = 0.9, failure: float = 1.0):
+    """
+    Smallest n >= 0 with 1 - failure * (1 - p)**n >= threshold.
+    Returns math.inf when no number of shots gets there (p <= 0, or threshold > 1).
+    """
+    if 1.0 - failure >= threshold:
+        return 0
+    if p >= 1.0 and 1.0 - failure * (1.0 - p) >= threshold:
+        return 1
+    if p <= 0.0 or p >= 1.0 or threshold > 1.0:
+        return math.inf
+
+    miss = max(1.0 - threshold, _MISS_FLOOR)
+    n = max(math.ceil(math.log(miss / failure) / math.log1p(-p)), 1)
+    # The log can land one shot off the iterative definition through rounding
+    while n > 1 and 1.0 - failure * (1.0 - p) ** (n - 1) >= threshold:
+        n -= 1
+    while 1.0 - failure * (1.0 - p) ** n < threshold:
+        n += 1
+    return n
+
+
+def cumulative_np(p, qty) -> np.ndarray:
+    """Vectorized cumulative(): arrays of p and shot counts broadcast together."""
+    p = np.asarray(p, dtype=float)
+    qty = np.asarray(qty, dtype=float)
+    return 1 - (1 - p) ** qty
+
+
+def shots_to_threshold_np(p, threshold=0.9, failure=1.0) -> np.ndarray:
+    """
+    Vectorized shots_to_threshold(). p, threshold and failure broadcast, so one weapon can
+    be swept over many thresholds, or every weapon of a plan checked against the miss
+    probability the earlier weapons left. Unreachable entries are np.inf.
+    """
+    p, threshold, failure = np.broadcast_arrays(np.asarray(p, dtype=float), np.asarray(threshold, dtype=float),
+                                                np.asarray(failure, dtype=float))
+    done = 1.0 - failure >= threshold
+    one = (p >= 1) & (1.0 - failure * (1.0 - p) >= threshold)
+    reachable = (p > 0) & (p < 1) & (threshold <= 1)
+    safe_p = np.where(reachable, p, 0.5)
+    safe_t = np.where(reachable, threshold, 0.5)
+    safe_f = np.where(reachable & (failure > 0), failure, 1.0)
+
+    miss = np.maximum(1.0 - safe_t, _MISS_FLOOR)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        n = np.maximum(np.ceil(np.log(miss / safe_f) / np.log1p(-safe_p)), 1)
+    n = np.where(np.isfinite(n), n, 1)
+    # The log can land one shot off the iterative definition through rounding
+    n = np.where((n > 1) & (1.0 - safe_f * (1.0 - safe_p) ** (n - 1) >= safe_t), n - 1, n)
+    n = np.where(1.0 - safe_f * (1.0 - safe_p) ** n < safe_t, n + 1, n)
+
+    return np.where(done, 0, np.where(one, 1, np.where(reachable, n, np.inf)))
+
+
+def qty_to_reach_threshold_np(p, qty, threshold=0.9):
+    """
+    Vectorized form of armament.qty_to_reach_threshold on per-shot probabilities (0..1).
+    Returns (cumulative_percent, qty_needed) arrays: cumulative at the shots actually
+    needed (or at qty when it falls short) rounded to 2 decimals, and the shots needed
+    for the threshold (0 when qty is not enough or the inputs are unusable).
+    """
+    p = np.asarray(p, dtype=float)
+    qty = np.asarray(qty, dtype=float)
+    usable = (qty > 0) & (p > 0)
+    needed = np.maximum(shots_to_threshold_np(np.where(usable, p, 0.5), threshold), 1)
+    reached = usable & (needed <= qty)
+    shots = np.where(reached, needed, np.where(usable, qty, 0))
+    pct = np.round(cumulative_np(np.where(usable, p, 0), shots) * 100, 2)
+    return np.where(usable, pct, 0.0), np.where(reached, needed, 0).astype(int)
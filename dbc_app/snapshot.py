@@ -0,0 +1,177 @@
+"""
+snapshot.py
+---------
+Per-cycle picture of the air shared by all evaluation modules.
+
+Purpose:
+- Read `bc3_with_all_vw` and `bc3_friends_vw` once at the start of an app.main() cycle.
+- Derive the tanker, AWACS, EW, SEAD and escort candidates from those frames using the
+  same filters `database.py` applies in SQL.
+- Hand the same snapshot to hostiles, fuel, support, time_to_target and armament so every
+  module works from one consistent view instead of re-querying the database.
+
+The snapshot is frozen: treat its frames and role lists as read-only.
+"""
+
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from functools import cached_property
+from typing import Any, Dict, Optional, Tuple
+import pandas as pd
+
+import database
+from spatial_index import SpatialIndex
+
+ROLES = ("tankers", "awacs", "ew", "sead", "escorts")
+
+# Previous cycle's track index, refreshed in place of a full rebuild when tracks only move
+_last_track_index = None
+
+
+def _key(value: Any) -> str:
+    """Normalize a track/JTN identifier so 255, 255.0 and '255' compare equal."""
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value).strip()
+
+
+def _records(df: pd.DataFrame) -> Tuple[Dict[str, Any], ...]:
+    """DataFrame -> tuple of row dicts, with NaN mapped to None like a psycopg2 fetch."""
+    if df.empty:
+        return ()
+    clean = df.astype(object).where(df.notna(), None)
+    return tuple(clean.to_dict("records"))
+
+
+def first_row_index(df: pd.DataFrame, column: str) -> Dict[Any, tuple]:
+    """
+    column value -> first df.itertuples(index=False) row holding it, i.e. what
+    next(row for row in df.itertuples(index=False) if value == row.<column>) finds.
+    Rows with a missing value are left out.
+    """
+    index: Dict[Any, tuple] = {}
+    if df is None or df.empty or column not in df.columns:
+        return index
+    for key, row in zip(df[column].tolist(), df.itertuples(index=False)):
+        if key is None or key != key:
+            continue
+        index.setdefault(key, row)
+    return index
+
+
+def _has_jtn(df: pd.DataFrame) -> pd.Series:
+    jtn = df["bc3_jtn"]
+    return jtn.notna() & (jtn.astype(str) != "[null]")
+
+
+def _role_frame(df: pd.DataFrame, aircraft_types, friend_only: bool = False) -> pd.DataFrame:
+    """Mirror of database.query_tankers / query_awacs / query_ew."""
+    if df.empty or not {"aircraft_type", "bc3_jtn", "trackid"} <= set(df.columns):
+        return df.iloc[0:0]
+    mask = df["aircraft_type"].isin(aircraft_types) & _has_jtn(df)
+    if friend_only:
+        mask &= df["trackid"] == "Friend"
+    return df[mask]
+
+
+def _weapon_frame(df: pd.DataFrame, weapon: str) -> pd.DataFrame:
+    """Mirror of database.query_assets("weapon", "ILIKE", "%<weapon>%")."""
+    if df.empty or not {"weapon", "aircraft_type"} <= set(df.columns):
+        return df.iloc[0:0]
+    carries = df["weapon"].astype(str).str.contains(weapon, case=False, regex=False) & df["weapon"].notna()
+    mask = carries & df["aircraft_type"].notna() & (df["aircraft_type"] != "DIS(265)")
+    return df[mask]
+
+
+@dataclass(frozen=True)
+class WorldSnapshot:
+    loaded_at: datetime
+    tracks: pd.DataFrame            # bc3_with_all_vw
+    friends: pd.DataFrame           # bc3_friends_vw
+    tankers: Tuple[Dict[str, Any], ...]
+    awacs: Tuple[Dict[str, Any], ...]
+    ew: Tuple[Dict[str, Any], ...]
+    sead: Tuple[Dict[str, Any], ...]
+    escorts: Tuple[Dict[str, Any], ...]
+    jtn_keys: pd.Series             # normalized tracks["bc3_jtn"]
+    tracknumber_keys: pd.Series     # normalized tracks["tracknumber"]
+    track_index: SpatialIndex       # grid over every track in `tracks`
+    role_indexes: Dict[str, SpatialIndex]
+
+    def role_index(self, role: str) -> SpatialIndex:
+        """Spatial index over one of ROLES, e.g. snapshot.role_index("tankers")."""
+        return self.role_indexes[role]
+
+    def track_by_jtn(self, bc3_jtn: Any) -> pd.DataFrame:
+        """Same rows as database.query_friendly_asset(bc3_jtn)."""
+        return self.tracks[self.jtn_keys == _key(bc3_jtn)].reset_index(drop=True)
+
+    def track_by_number(self, tracknumber: Any) -> pd.DataFrame:
+        """Same rows as database.get_groundspeed(tracknumber)."""
+        return self.tracks[self.tracknumber_keys == _key(tracknumber)].reset_index(drop=True)
+
+    @cached_property
+    def friends_by_merged_tracknumber(self) -> Dict[Any, tuple]:
+        """First bc3_friends_vw row per merged_tracknumber, built on first use."""
+        return first_row_index(self.friends, "merged_tracknumber")
+
+    @cached_property
+    def tracks_by_tracknumber(self) -> Dict[Any, tuple]:
+        """First bc3_with_all_vw row per tracknumber, built on first use."""
+        return first_row_index(self.tracks, "tracknumber")
+
+    def trackcategory(self, tracknumber: Any) -> Optional[str]:
+        rows = self.track_by_number(tracknumber)
+        if rows.empty or "trackcategory" not in rows.columns:
+            return None
+        value = rows.loc[0, "trackcategory"]
+        return value if isinstance(value, str) else None
+
+
+def load() -> Optional[WorldSnapshot]:
+    """
+    Read the track picture once and derive every support role from it.
+    Returns None when either view cannot be read: an empty picture would score every
+    friendly as "no hostiles, no support", so the cycle is skipped instead.
+    The view is read whole and unboxed: AWACS, EW and SEAD rows go into the support
+    report with every column, and the picture serves hostiles anywhere in theatre. The
+    bounding-box and column-projected reads in database.py serve only the callers that
+    run without a snapshot.
+    """
+    global _last_track_index
+    try:
+        tracks = database.query_bc3_with_all_vw(raise_errors=True)
+        friends = database.query_bc3_friends_vw(raise_errors=True)
+    except Exception as e:
+        print("Error loading snapshot, skipping cycle:", e)
+        return None
+
+    if _last_track_index is None:
+        track_index = SpatialIndex.from_frame(tracks)
+    else:
+        track_index = _last_track_index.refresh(tracks)
+    _last_track_index = track_index
+
+    roles = {
+        "tankers": _records(_role_frame(tracks, database.TANKER_TYPES)),
+        "awacs": _records(_role_frame(tracks, database.AWACS_TYPES)),
+        "ew": _records(_role_frame(tracks, database.EW_TYPES, friend_only=True)),
+        "sead": _records(_weapon_frame(tracks, "AGM-88")),
+        "escorts": _records(_weapon_frame(tracks, "AIM-120")),
+    }
+
+    def keys(column: str) -> pd.Series:
+        if column not in tracks.columns:
+            return pd.Series([None] * len(tracks), index=tracks.index, dtype=object)
+        return tracks[column].map(_key)
+
+    return WorldSnapshot(
+        loaded_at=datetime.now(timezone.utc),
+        tracks=tracks,
+        friends=friends,
+        jtn_keys=keys("bc3_jtn"),
+        tracknumber_keys=keys("tracknumber"),
+        track_index=track_index,
+        role_indexes={role: SpatialIndex.from_records(records) for role, records in roles.items()},
+        **roles,
+    )
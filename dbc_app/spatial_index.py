@@ -0,0 +1,238 @@
+"""
+spatial_index.py
+---------
+Lat/lon grid index over the bc3 track picture.
+
+Purpose:
+- Bucket tracks into CELL_DEG x CELL_DEG cells so radius and nearest-neighbour searches
+  only look at the cells around the query point instead of scanning every row.
+- `within_radius(lat, lon, km, filter)` returns every track closer than `km`.
+- `k_nearest(lat, lon, k, filter)` returns the `k` closest tracks, nearest first.
+- `refresh(frame)` re-buckets only the tracks that moved when the next cycle's picture
+  has the same tracks in the same order and few of them changed cell, and rebuilds
+  otherwise.
+
+`filter` narrows the candidates and may be:
+- a boolean array aligned with the indexed rows,
+- a mapping of column -> value (or list/tuple/set of accepted values),
+- a callable taking the row dict and returning a bool.
+"""
+
+import math
+import os
+from typing import Any, Dict, List, NamedTuple, Optional, Sequence
+import numpy as np
+import pandas as pd
+
+import geo
+
+CELL_DEG = float(os.getenv("SPATIAL_CELL_DEG", "1.0"))
+# refresh() rebuilds the grid outright once more than this fraction of tracks changed cell
+REBUCKET_MAX_FRACTION = float(os.getenv("SPATIAL_REBUCKET_MAX_FRACTION", "0.2"))
+KM_PER_DEG = geo.EARTH_RADIUS_KM * math.pi / 180
+HALF_CIRCUMFERENCE_KM = geo.EARTH_RADIUS_KM * math.pi
+
+
+class Hit(NamedTuple):
+    distance_km: float
+    position: int          # row position in the indexed frame/records
+    record: Dict[str, Any]
+
+
+def _to_float(value: Any) -> float:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float("nan")
+
+
+class SpatialIndex:
+    def __init__(self, lats, lons, records: Optional[Sequence[Dict[str, Any]]] = None,
+                 frame: Optional[pd.DataFrame] = None, keys=None, cell_deg: float = CELL_DEG):
+        self.lats = np.asarray(lats, dtype=float)
+        self.lons = np.asarray(lons, dtype=float)
+        self.keys = None if keys is None else np.asarray(keys, dtype=object)
+        self.cell_deg = cell_deg
+        self.n_rows = len(self.lats)
+        self.n_cols = int(math.ceil(360 / cell_deg))
+        self._records = records
+        self._frame = frame
+        self._columns: Dict[str, np.ndarray] = {}
+        self._cells: Dict[tuple, np.ndarray] = {}
+        self._build()
+
+    # ---------- construction ----------
+    @classmethod
+    def from_frame(cls, df: pd.DataFrame, lat_col="latitude", lon_col="longitude",
+                   key_col="tracknumber", cell_deg: float = CELL_DEG) -> "SpatialIndex":
+        if df is None or df.empty or lat_col not in df.columns or lon_col not in df.columns:
+            return cls([], [], records=[], cell_deg=cell_deg)
+        lats = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(dtype=float)
+        lons = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(dtype=float)
+        keys = df[key_col].to_numpy(dtype=object) if key_col in df.columns else None
+        return cls(lats, lons, frame=df, keys=keys, cell_deg=cell_deg)
+
+    @classmethod
+    def from_records(cls, records: Sequence[Dict[str, Any]], lat_key="latitude", lon_key="longitude",
+                     key_field="tracknumber", cell_deg: float = CELL_DEG) -> "SpatialIndex":
+        records = list(records or [])
+        lats = [_to_float(r.get(lat_key)) for r in records]
+        lons = [_to_float(r.get(lon_key)) for r in records]
+        keys = [r.get(key_field) for r in records]
+        return cls(lats, lons, records=records, keys=keys, cell_deg=cell_deg)
+
+    def _cell_ids(self, lats, lons):
+        ilat = np.floor((lats + 90) / self.cell_deg).astype(np.int64)
+        ilon = np.floor((lons + 180) / self.cell_deg).astype(np.int64) % self.n_cols
+        return ilat, ilon
+
+    def _build(self):
+        self._cells = {}
+        valid = np.flatnonzero(~(np.isnan(self.lats) | np.isnan(self.lons)))
+        if valid.size == 0:
+            return
+        ilat, ilon = self._cell_ids(self.lats[valid], self.lons[valid])
+        cell_code = ilat * self.n_cols + ilon
+        order = np.argsort(cell_code, kind="stable")
+        codes, starts = np.unique(cell_code[order], return_index=True)
+        for code, group in zip(codes, np.split(valid[order], starts[1:])):
+            self._cells[(int(code) // self.n_cols, int(code) % self.n_cols)] = group
+
+    def refresh(self, df: pd.DataFrame, lat_col="latitude", lon_col="longitude",
+                key_col="tracknumber") -> "SpatialIndex":
+        """
+        Index for the next cycle's picture. When it holds the same tracks in the same order
+        and at most REBUCKET_MAX_FRACTION of them changed cell, only those are re-bucketed;
+        otherwise the grid is rebuilt, which is faster once many tracks move.
+        Returns a new index and leaves this one untouched for readers of the old snapshot.
+        """
+        if (df is None or key_col not in df.columns or self.keys is None or len(df) != self.n_rows
+                or not np.array_equal(df[key_col].to_numpy(dtype=object), self.keys)):
+            return SpatialIndex.from_frame(df, lat_col, lon_col, key_col, self.cell_deg)
+
+        lats = pd.to_numeric(df[lat_col], errors="coerce").to_numpy(dtype=float)
+        lons = pd.to_numeric(df[lon_col], errors="coerce").to_numpy(dtype=float)
+        fresh = SpatialIndex.__new__(SpatialIndex)
+        fresh.__dict__.update(self.__dict__)
+        fresh.lats, fresh.lons = lats, lons
+        fresh._frame, fresh._records, fresh._columns = df, None, {}
+        fresh._cells = dict(self._cells)
+
+        old_valid = ~(np.isnan(self.lats) | np.isnan(self.lons))
+        new_valid = ~(np.isnan(lats) | np.isnan(lons))
+        old_ilat, old_ilon = self._cell_ids(np.nan_to_num(self.lats), np.nan_to_num(self.lons))
+        new_ilat, new_ilon = self._cell_ids(np.nan_to_num(lats), np.nan_to_num(lons))
+        moved = (old_valid != new_valid) | (old_valid & ((old_ilat != new_ilat) | (old_ilon != new_ilon)))
+        if np.count_nonzero(moved) > REBUCKET_MAX_FRACTION * self.n_rows:
+            return SpatialIndex(lats, lons, frame=df, keys=self.keys, cell_deg=self.cell_deg)
+
+        for pos in np.flatnonzero(moved):
+            if old_valid[pos]:
+                cell = (int(old_ilat[pos]), int(old_ilon[pos]))
+                remaining = fresh._cells[cell][fresh._cells[cell] != pos]
+                if remaining.size:
+                    fresh._cells[cell] = remaining
+                else:
+                    del fresh._cells[cell]
+            if new_valid[pos]:
+                cell = (int(new_ilat[pos]), int(new_ilon[pos]))
+                fresh._cells[cell] = np.sort(np.append(fresh._cells.get(cell, np.empty(0, dtype=np.int64)), pos))
+        return fresh
+
+    # ---------- row access ----------
+    def __len__(self):
+        return self.n_rows
+
+    def record(self, pos: int) -> Dict[str, Any]:
+        if self._records is not None:
+            return self._records[pos]
+        row = self._frame.iloc[pos]
+        return {k: (None if (not isinstance(v, (list, dict)) and pd.isna(v)) else v) for k, v in row.items()}
+
+    def column(self, name: str) -> np.ndarray:
+        if name not in self._columns:
+            if self._records is not None:
+                self._columns[name] = np.array([r.get(name) for r in self._records], dtype=object)
+            elif self._frame is not None and name in self._frame.columns:
+                self._columns[name] = self._frame[name].to_numpy(dtype=object)
+            else:
+                self._columns[name] = np.full(self.n_rows, None, dtype=object)
+        return self._columns[name]
+
+    def _apply_filter(self, cand: np.ndarray, filter: Any) -> np.ndarray:
+        if filter is None or cand.size == 0:
+            return cand
+        if isinstance(filter, np.ndarray):
+            return cand[filter[cand]]
+        if isinstance(filter, dict):
+            keep = np.ones(cand.size, dtype=bool)
+            for name, accepted in filter.items():
+                values = self.column(name)[cand]
+                if isinstance(accepted, (list, tuple, set, frozenset)):
+                    keep &= np.isin(values, list(accepted))
+                else:
+                    keep &= values == accepted
+            return cand[keep]
+        if callable(filter):
+            return cand[np.fromiter((bool(filter(self.record(p))) for p in cand), dtype=bool, count=cand.size)]
+        raise TypeError(f"Unsupported spatial filter: {type(filter).__name__}")
+
+    # ---------- queries ----------
+    def _candidates(self, lat: float, lon: float, km: float) -> np.ndarray:
+        """Positions in every cell that can hold a point within `km` of (lat, lon)."""
+        if not self._cells:
+            return np.empty(0, dtype=np.int64)
+        dlat = km / KM_PER_DEG
+        lat_lo, lat_hi = max(lat - dlat, -90.0), min(lat + dlat, 90.0)
+        max_abs_lat = max(abs(lat_lo), abs(lat_hi))
+        cos_lat = math.cos(math.radians(max_abs_lat))
+        all_lons = km >= HALF_CIRCUMFERENCE_KM or cos_lat < 1e-6 or dlat / cos_lat >= 180
+        ilat_lo, _ = self._cell_ids(np.array(lat_lo), np.array(0.0))
+        ilat_hi, _ = self._cell_ids(np.array(lat_hi), np.array(0.0))
+        if all_lons:
+            cols = None
+        else:
+            dlon = dlat / cos_lat
+            _, ilon_lo = self._cell_ids(np.array(0.0), np.array(lon - dlon))
+            span = int(math.ceil(2 * dlon / self.cell_deg)) + 1
+            cols = {(int(ilon_lo) + i) % self.n_cols for i in range(min(span, self.n_cols))}
+
+        lat_range = range(int(ilat_lo), int(ilat_hi) + 1)
+        if cols is None or len(lat_range) * len(cols) > len(self._cells):
+            # Fewer occupied cells than cells in the box: scan the occupied ones
+            parts = [members for (ilat, ilon), members in self._cells.items()
+                     if ilat in lat_range and (cols is None or ilon in cols)]
+        else:
+            parts = [self._cells[(ilat, ilon)] for ilat in lat_range for ilon in cols
+                     if (ilat, ilon) in self._cells]
+        if not parts:
+            return np.empty(0, dtype=np.int64)
+        return np.sort(np.concatenate(parts))
+
+    def _measure(self, lat: float, lon: float, cand: np.ndarray) -> np.ndarray:
+        return geo.haversine_np(lat, lon, self.lats[cand], self.lons[cand])
+
+    def within_radius(self, lat: float, lon: float, km: float, filter: Any = None) -> List[Hit]:
+        """Every row strictly closer than `km`, in row order."""
+        cand = self._apply_filter(self._candidates(lat, lon, km), filter)
+        if cand.size == 0:
+            return []
+        dist = self._measure(lat, lon, cand)
+        inside = dist < km
+        return [Hit(float(d), int(p), self.record(int(p))) for p, d in zip(cand[inside], dist[inside])]
+
+    def k_nearest(self, lat: float, lon: float, k: int, filter: Any = None) -> List[Hit]:
+        """The `k` closest rows, nearest first (ties keep row order)."""
+        if k <= 0 or not self._cells:
+            return []
+        km = max(self.cell_deg * KM_PER_DEG, 1.0)
+        while True:
+            cand = self._apply_filter(self._candidates(lat, lon, km), filter)
+            dist = self._measure(lat, lon, cand) if cand.size else np.empty(0)
+            # Everything within km has been seen, so the k nearest under km are final
+            inside = dist <= km
+            if inside.sum() >= k or km >= HALF_CIRCUMFERENCE_KM:
+                cand, dist = cand[inside], dist[inside]
+                order = np.lexsort((cand, dist))[:k]
+                return [Hit(float(dist[i]), int(cand[i]), self.record(int(cand[i]))) for i in order]
+            km *= 2
@@ -1,46 +1,21 @@
 import database
-import math 
+import os
+import numpy as np
 import fuel
-import re
+import geo
+import track_parser
+from spatial_index import SpatialIndex
 
-# -----------------------------
-# Utility Functions
-# -----------------------------
-def haversine(lat1, lon1, lat2, lon2):
-    """
-    Calculate the great-circle distance between two points on the Earth in km.
-    """
-    R = 6371  # Earth radius in km
-    phi1 = math.radians(lat1)
-    phi2 = math.radians(lat2)
-    delta_phi = math.radians(lat2 - lat1)
-    delta_lambda = math.radians(lon2 - lon1)
+# First radius (km) tried when searching the database for the nearest support assets
+SUPPORT_SEARCH_KM = float(os.getenv("SUPPORT_SEARCH_KM", "250"))
 
-    a = math.sin(delta_phi/2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda/2)**2
-    c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
-    return R * c
-
-def parse_track_info(track_string):
-    """
-    Regex to capture the main ID and all key-value pairs inside parentheses
-    """
-    match = re.match(r"(\d+)\s*\((.*)\)", track_string)
-    if not match:
-        return None
-       
-    track_id = match.group(1)
-    key_values = match.group(2)
- 
-    # Convert key-value pairs to a dictionary
-    info_dict = {}
-    for kv in key_values.split(","):
-        key, value = kv.split(":", 1)
-        info_dict[key.strip()] = value.strip()
-       
-    # Include the main ID as well
-    info_dict["ID"] = track_id
-    return info_dict
+# Most escorts paired with one friendly (one per hostile plus one otherwise), so a large
+# hostile count cannot turn the escort search into a theatre-wide scan
+MAX_ESCORTS = int(os.getenv("SUPPORT_MAX_ESCORTS", "4"))
 
+# bc3_with_all_vw columns the escort report is built from (AWACS, EW and SEAD rows are
+# reported whole, so reads that include them keep every column)
+ESCORT_COLUMNS = ("bc3_jtn", "bc3_vcs", "callsign", "latitude", "longitude", "aircraft_type", "tracknumber")
 
 # Mission Pairing
 #----------------
@@ -52,10 +27,85 @@ def parse_track_info(track_string):
 # -----------------------------
 # Support Finders
 # -----------------------------
+def _role_rows(frame, role):
+    """One role's rows of a query_support_candidates frame, without the role column."""
+    if frame.empty or "role" not in frame.columns:
+        return frame.iloc[0:0]
+    return frame[frame["role"] == role].drop(columns="role").reset_index(drop=True)
 
-def find_tankers(friendly):
+class SupportCandidates:
+    """
+    Support-role candidates from one role-tagged query (database.query_support_candidates),
+    with one spatial index per role. Has the same role_index() as WorldSnapshot, so the
+    finders below take either.
+    """
+
+    def __init__(self, role_indexes):
+        self.role_indexes = role_indexes
+
+    @classmethod
+    def load(cls, lat, lon, needs, columns=None, km=SUPPORT_SEARCH_KM):
+        """
+        Candidates for each role in `needs`: role -> how many nearest (lat, lon) are wanted,
+        or None for every row of the role. Counted roles are read from a bounding box around
+        (lat, lon); roles whose k nearest are not all inside the box are read again once,
+        unboxed, so nothing closer was left outside. At most two queries per load.
+        """
+        role_indexes = {role: SpatialIndex.from_records([]) for role, k in needs.items() if k == 0}
+        pending = {role: k for role, k in needs.items() if k != 0}
+        boxes = geo.bounding_box(lat, lon, km)
+        while pending:
+            frame = database.query_support_candidates(
+                {role: None if k is None else boxes for role, k in pending.items()}, columns)
+            for role, k in list(pending.items()):
+                index = SpatialIndex.from_frame(_role_rows(frame, role))
+                if k is not None and boxes is not None:
+                    hits = index.k_nearest(lat, lon, k)
+                    if len(hits) < k or hits[-1].distance_km > km:
+                        continue
+                role_indexes[role] = index
+                del pending[role]
+            # Short roles fall back to the whole table
+            boxes = None
+        return cls(role_indexes)
+
+    def role_index(self, role):
+        return self.role_indexes[role]
+
+def role_index(snapshot, role, friendly, k=1, columns=None):
+    """Spatial index over one support role: the snapshot's (or candidates'), or read around the friendly."""
+    if snapshot is not None:
+        return snapshot.role_index(role)
+    return SupportCandidates.load(float(friendly["lat"]), float(friendly["lon"]), {role: k}, columns).role_index(role)
+
+def escort_count(hostile):
+    """Escorts to pair against `hostile` detected hostiles: one each plus one, up to MAX_ESCORTS."""
+    return max(0, min(hostile + 1, MAX_ESCORTS))
+
+def nearest_escorts(index, lat, lon, target, k):
+    """
+    (record, km to target) for the k rows of `index` nearest (lat, lon), nearest first.
+    Distances to the friendly and to the target come from one vectorized pass, and
+    argpartition picks the k without sorting every escort.
+    """
+    if k <= 0 or len(index.lats) == 0:
+        return []
+    to_friendly, to_target = geo.haversine_np(np.array([[lat], [target.latitude]]),
+                                              np.array([[lon], [target.longitude]]),
+                                              index.lats, index.lons)
+    positions = np.flatnonzero(~np.isnan(to_friendly))
+    if positions.size > k:
+        positions = positions[np.argpartition(to_friendly[positions], k - 1)[:k]]
+    positions = positions[np.lexsort((positions, to_friendly[positions]))]
+    return [(index.record(int(pos)), float(to_target[pos])) for pos in positions]
+
+def nearest_in(index, friendly):
+    hits = index.k_nearest(float(friendly["lat"]), float(friendly["lon"]), 1)
+    return hits[0].record if hits else None
+
+def find_tankers(friendly, snapshot=None):
     nearest_tanker = None
-    tanker_list = database.query_tankers()
+    tanker_list = snapshot.tankers if snapshot is not None else database.query_tankers()
     min_distance = float("inf")
 
     for row in tanker_list:
@@ -63,29 +113,21 @@ def find_tankers(friendly):
         # print(parsed)
         escort_lat = float(row["latitude"])
         escort_lon = float(row["latitude"])
-        distance = haversine(escort_lat, escort_lon, float(friendly["lat"]), float(friendly["lon"]))
+        distance = geo.haversine(escort_lat, escort_lon, float(friendly["lat"]), float(friendly["lon"]))
         if distance < min_distance:
             min_distance = distance
             nearest_tanker = row
     return nearest_tanker
 
 # Edit for different 
-def find_escort(friendly, hostile, target):
+def find_escort(friendly, hostile, target, snapshot=None):
     
-    escort_list = database.query_assets("weapon","ILIKE", "%AIM-120%")
-    escort_distances = []
+    lat, lon = float(friendly["lat"]), float(friendly["lon"])
 
-    for row in escort_list:
-        escort_lat = float(row["latitude"])
-        escort_lon = float(row["longitude"])  # Make sure this isn't latitude again!
-        distance = haversine(escort_lat, escort_lon, float(friendly["lat"]), float(friendly["lon"]))
-        escort_distances.append((distance, row))
-
-    # Sort escorts by distance
-    escort_distances.sort(key=lambda x: x[0])
-
-    # Select top n + 1 closest escorts
-    nearest_escort = [row for _, row in escort_distances[:hostile + 1]]
+    # Select top n + 1 closest escorts (capped)
+    k = escort_count(hostile)
+    index = role_index(snapshot, "escorts", friendly, k, columns=ESCORT_COLUMNS)
+    nearest_escort = nearest_escorts(index, lat, lon, target, k)
     escort_report = {
         "escort": [
           {
@@ -96,73 +138,49 @@ def find_escort(friendly, hostile, target):
                 "lon": escort["longitude"],
                 "aircraft_type": escort["aircraft_type"],
                 "tracknumber": escort["tracknumber"],
-                "distance_km": haversine(
-                    escort["latitude"],
-                    escort["longitude"],
-                    float(target["Latitude"]),
-                    float(target["Longitude"])
-                ),
+                "distance_km": distance_km,
             }
-        for escort in nearest_escort
+        for escort, distance_km in nearest_escort
         ]
     }
     return escort_report
 
-def find_awac(friendly):
-    min_distance = float("inf")
-    awacs_list = database.query_awacs()
-    for awacs in awacs_list:
-        awacs_lat = float(awacs["latitude"])
-        awacs_lon = float(awacs["longitude"])
-        distance = haversine(float(friendly["lat"]), float(friendly["lon"]), awacs_lat, awacs_lon)
-        if distance < min_distance:
-            min_distance = distance
-            nearest = awacs
-    return nearest
+def find_awac(friendly, snapshot=None):
+    return nearest_in(role_index(snapshot, "awacs", friendly), friendly)
 
-def find_ew(friendly):
-    min_distance = float("inf")
-    ew_list = database.query_ew()
-    for ew in ew_list:
-        ew_lat = float(ew["latitude"])
-        ew_lon = float(ew["longitude"])
-        distance = haversine(float(friendly["lat"]), float(friendly["lon"]), ew_lat, ew_lon)
-        if distance < min_distance:
-            min_distance = distance
-            nearest = ew
-    return nearest
+def find_ew(friendly, snapshot=None):
+    return nearest_in(role_index(snapshot, "ew", friendly), friendly)
 
-def find_sead(friendly):
-    min_distance = float("inf")
-    sead_list = database.query_assets("weapon","ILIKE", "%AGM-88%")
-    for sead in sead_list:
-        sead_lat = float(sead["latitude"])
-        sead_lon = float(sead["longitude"])
-        distance = haversine(float(friendly["lat"]), float(friendly["lon"]), sead_lat, sead_lon)
-        if distance < min_distance:
-            min_distance = distance
-            nearest = sead
-    return nearest
+def find_sead(friendly, snapshot=None):
+    return nearest_in(role_index(snapshot, "sead", friendly), friendly)
 
 
 # -----------------------------
 # Main Code
 # -----------------------------
-def gather_support(friendly, target, hostiles):
+def gather_support(friendly, target, hostiles, snapshot=None):
     # asset = friendly["bc3_jtn"]
-    target_data = parse_track_info(target)
-    # tankers = find_tankers(friendly)
-    awacs = find_awac(friendly)
-    ew = find_ew(friendly)
-    sead = find_sead(friendly)
+    target_data = track_parser.parse_target(target)
     hostile_code = hostiles[0]
     hostile_data = hostiles[1]
+    # Without a snapshot, every role this friendly needs comes from one boxed query
+    # (tankers unboxed: they are ranked by route to the target, not by distance)
+    needs = {"awacs": 1, "ew": 1, "sead": 1}
+    if hostile_code < 4:
+        needs.update(escorts=escort_count(len(hostile_data)), tankers=None)
+    candidates = snapshot if snapshot is not None else SupportCandidates.load(
+        float(friendly["lat"]), float(friendly["lon"]), needs)
+    # tankers = find_tankers(friendly, snapshot)
+    awacs = find_awac(friendly, candidates)
+    ew = find_ew(friendly, candidates)
+    sead = find_sead(friendly, candidates)
     fuel_report = []
 
     if hostile_code < 4:
-        escort_report = find_escort(friendly, len(hostile_data), target_data)
-        for item in escort_report["escort"]:
-            fuel_report.append(fuel.analyze_fuel(item, target))
+        escort_report = find_escort(friendly, len(hostile_data), target_data, candidates)
+        # One fuel query for every escort, checked against the tankers already loaded
+        fuel_report = fuel.analyze_fuel_batch(escort_report["escort"], target, snapshot,
+                                              tankers=candidates.role_index("tankers"))
         escorts = escort_report["escort"]
     else:
         escorts = "None"
@@ -0,0 +1,56 @@
+"""
+test_armament.py
+---------
+Smoke test for armament.check_armaments through the red catalog path.
+
+Purpose:
+- Run check_armaments end to end with database.fetch_catalog stubbed, so a broken
+  catalog lookup fails here instead of emptying every COA at run time.
+
+Usage:
+    python -m pytest dbc_app/test_armament.py
+"""
+
+import json
+
+import pandas as pd
+
+import armament
+import database
+
+ENEMY = "44875 (CallSign: None, Track Cat: Air, Track ID: Hostile, Aircraft Type: None, Lattitude: 23.94, Longitude: -78.38)"
+FRIENDLY = {
+    "callsign": "HARPY 02",
+    "weapon": "2XAIM-9, 3XAIM-120",
+    "aircraft_type": "F-A-22",
+    "trackcategory": "air",
+}
+CATALOG = pd.DataFrame({
+    "weapon": ["AIM-120 AMRAAM", "AIM-9X Sidewinder"],
+    "effectiveness_percentage": [60.0, 30.0],
+    "range_nm": [80, 20],
+})
+
+
+def test_check_armaments_reads_the_catalog(monkeypatch):
+    calls = []
+
+    def fetch_catalog(family, kind, domain, columns=None, cache=True):
+        calls.append((family, kind, domain))
+        return CATALOG
+
+    monkeypatch.setattr(database, "fetch_catalog", fetch_catalog)
+    monkeypatch.setattr(armament, "_COMPILED", {})
+
+    payload = json.loads(armament.check_armaments([FRIENDLY], ENEMY))
+
+    assert calls == [("air", "del", "a2a")]
+    assert payload["app_code"] == 4
+    [row] = payload["results"]
+    assert row["friendly_id"] == "HARPY 02"
+    assert row["weapon"] == "AIM-120"
+    assert row["qty_needed_for_90"] == 3
+    assert row["total_effectiveness_percent"] == 93.6
+
+    # The compiled catalog is reused while the cached table is unchanged
+    assert armament.fetch_catalog("air", "air") is armament.fetch_catalog("air", "air")
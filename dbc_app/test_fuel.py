@@ -0,0 +1,69 @@
+"""
+test_fuel.py
+---------
+Tests for aircraft type canonicalization and the batched fuel analysis.
+
+Purpose:
+- Spellings of one airframe must share its performance row, and unknown types the
+  worst-case "NaN" row.
+- analyze_fuel_batch must give each asset the code analyze_fuel documents, with the
+  asset rows and tankers supplied directly instead of read from the database.
+
+Usage:
+    python -m pytest dbc_app/test_fuel.py
+"""
+
+import pandas as pd
+
+import fuel
+
+TARGET = "44875 (CallSign: None, Track Cat: Air, Track ID: Hostile, Aircraft Type: None, Latitude: 20.0, Longitude: 0.0)"
+TANKERS = [
+    {"bc3_jtn": 900, "bc3_vcs": "T1", "callsign": "SHELL 1", "latitude": 10.5, "longitude": 0.0},
+    {"bc3_jtn": 901, "bc3_vcs": "T2", "callsign": "SHELL 2", "latitude": -40.0, "longitude": 90.0},
+]
+
+
+class FakeSnapshot:
+    """Fuel and groundspeed rows by bc3_jtn, as WorldSnapshot.track_by_jtn returns them."""
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def track_by_jtn(self, jtn):
+        return pd.DataFrame([self.rows[jtn]]) if jtn in self.rows else pd.DataFrame()
+
+
+def _asset(jtn, distance_km, lat=10.0):
+    return {"bc3_jtn": jtn, "aircraft_type": "F-A-22", "distance_km": distance_km, "lat": lat, "lon": 0.0}
+
+
+def test_canonical_type_spellings():
+    assert fuel.canonical_type("F-35A") == fuel.canonical_type(" f 35a ") == "F35A"
+    assert fuel.canonical_type("F-A-22") == fuel.canonical_type("F22") == "F22"
+    assert fuel.canonical_type("B-2 SPIR") == "B2"
+    for empty in (None, float("nan"), "", "[null]", "None"):
+        assert fuel.canonical_type(empty) is None
+
+
+def test_aircraft_profile_rows():
+    assert fuel.aircraft_profile("F-A-22") is fuel.aircraft_profile("f22")
+    assert fuel.aircraft_profile("F-A-22")["max_fuel_capacity"] == 18000
+    assert fuel.airframe_id("Sopwith Camel") == fuel.UNKNOWN_ID
+    assert fuel.aircraft_profile(None) is fuel.aircraft_profile("NaN")
+
+
+def test_analyze_fuel_batch_codes():
+    # 850 km/h cruise: the F-22 burns its base 8000 lbs/hr
+    snapshot = FakeSnapshot({jtn: {"fuel": 5000.0, "groundspeed": 850 / 3.6} for jtn in (1, 2, 3)})
+    assets = [_asset(1, 100.0), _asset(2, 2000.0), _asset(3, 9000.0)]
+
+    direct, refuel, too_far = fuel.analyze_fuel_batch(assets, TARGET, snapshot, tankers=TANKERS)
+
+    assert direct == 4
+    assert refuel["score"] == 3 and refuel["tanker_callsign"] == "SHELL 1" and refuel["route_km"] > 2000.0
+    report, reason = too_far
+    assert (report["score"], report["tanker_callsign"], reason) == (2, "SHELL 1", "Cannot reach target after refuel")
+
+    assert fuel.analyze_fuel_batch(assets[1:2], TARGET, snapshot, tankers=[])[0] == (1, "No tankers available")
+    assert fuel.analyze_fuel_batch([], TARGET, snapshot) == []
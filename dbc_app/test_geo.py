@@ -0,0 +1,53 @@
+"""
+test_geo.py
+---------
+Tests for the great-circle helpers.
+
+Purpose:
+- bounding_box must hold every point of the circle, so the SQL box filter never drops a
+  track the exact haversine check would have kept, including at the poles and across
+  the antimeridian.
+
+Usage:
+    python -m pytest dbc_app/test_geo.py
+"""
+
+import numpy as np
+
+import geo
+
+
+def _in_boxes(boxes, lats, lons):
+    inside = np.zeros(lats.shape, dtype=bool)
+    for lat_min, lat_max, lon_min, lon_max in boxes:
+        inside |= (lats >= lat_min) & (lats <= lat_max) & (lons >= lon_min) & (lons <= lon_max)
+    return inside
+
+
+def test_haversine_scalar_and_array_agree():
+    assert geo.haversine(0, 0, 0, 0) == 0
+    assert abs(geo.haversine(0, 0, 0, 1) - geo.KM_PER_DEG) < 1e-9
+    lats, lons = np.array([10.0, -45.0, np.nan]), np.array([20.0, 170.0, 0.0])
+    dist = geo.haversine_np(5.0, -3.0, lats, lons)
+    assert dist[:2].tolist() == [geo.haversine(5.0, -3.0, a, b) for a, b in zip(lats[:2], lons[:2])]
+    assert np.isnan(dist[2])
+
+
+def test_bounding_box_holds_the_circle():
+    rng = np.random.default_rng(5)
+    lats, lons = rng.uniform(-90, 90, 20000), rng.uniform(-180, 180, 20000)
+    for lat, lon in [(0.0, 0.0), (45.0, 179.5), (-30.0, -179.0), (88.0, 0.0), (-70.0, 60.0)]:
+        for km in (10.0, 300.0, 2500.0):
+            boxes = geo.bounding_box(lat, lon, km)
+            within = geo.haversine_np(lat, lon, lats, lons) <= km
+            assert _in_boxes(boxes, lats, lons)[within].all()
+            for lat_min, lat_max, lon_min, lon_max in boxes:
+                assert -90 <= lat_min <= lat_max <= 90 and -180 <= lon_min <= lon_max <= 180
+
+
+def test_bounding_box_edges():
+    assert len(geo.bounding_box(10.0, 179.9, 100.0)) == 2
+    assert len(geo.bounding_box(10.0, -179.9, 100.0)) == 2
+    [(_, _, lon_min, lon_max)] = geo.bounding_box(89.5, 0.0, 100.0)
+    assert (lon_min, lon_max) == (-180.0, 180.0)
+    assert geo.bounding_box(0.0, 0.0, geo.EARTH_RADIUS_KM * np.pi) is None
@@ -0,0 +1,60 @@
+"""
+test_probability.py
+---------
+Tests for the closed-form kill-probability math.
+
+Purpose:
+- Check shots_to_threshold and its array form against the shot-by-shot definition they
+  replace, including the thresholds where the logarithm rounds a shot off.
+
+Usage:
+    python -m pytest dbc_app/test_probability.py
+"""
+
+import math
+
+import numpy as np
+
+import probability
+
+
+def _shots_by_loop(p, threshold, failure=1.0):
+    n = 0
+    while 1.0 - failure * (1.0 - p) ** n < threshold:
+        n += 1
+    return n
+
+
+def test_shots_to_threshold_matches_the_loop():
+    rng = np.random.default_rng(7)
+    for p, threshold, failure in zip(rng.uniform(0.01, 0.99, 500), rng.uniform(0.05, 0.999, 500),
+                                     rng.uniform(0.05, 1.0, 500)):
+        expected = _shots_by_loop(p, threshold, failure)
+        assert probability.shots_to_threshold(p, threshold, failure) == expected
+        assert probability.shots_to_threshold_np(p, threshold, failure) == expected
+
+
+def test_shots_to_threshold_at_exact_boundaries():
+    # 1 - 0.5**n lands exactly on these thresholds
+    for n in range(1, 8):
+        threshold = 1 - 0.5 ** n
+        assert probability.shots_to_threshold(0.5, threshold) == _shots_by_loop(0.5, threshold) == n
+    assert probability.shots_to_threshold(0.6, 0.9) == 3
+    assert probability.shots_to_threshold(0.5, 0.9, failure=0.05) == 0
+
+
+def test_unreachable_thresholds():
+    assert probability.shots_to_threshold(0.0, 0.9) == math.inf
+    assert probability.shots_to_threshold(0.5, 1.1) == math.inf
+    assert probability.shots_to_threshold(1.0, 0.9) == 1
+    assert probability.shots_to_threshold(0.5, 1.0) < math.inf
+
+    got = probability.shots_to_threshold_np([0.0, 0.5, 1.0, 0.5], [0.9, 1.1, 0.9, 0.9])
+    np.testing.assert_array_equal(got, [np.inf, np.inf, 1, 4])
+
+
+def test_qty_to_reach_threshold_np():
+    pct, needed = probability.qty_to_reach_threshold_np([0.6, 0.6, 0.3, 0.0], [3, 2, 10, 4])
+
+    np.testing.assert_array_equal(needed, [3, 0, 7, 0])
+    np.testing.assert_array_equal(pct, [93.6, 84.0, round((1 - 0.7 ** 7) * 100, 2), 0.0])
@@ -0,0 +1,79 @@
+"""
+test_spatial_index.py
+---------
+Tests for the lat/lon grid index against a brute-force scan.
+
+Purpose:
+- Radius and nearest-neighbour searches must return exactly what measuring every track
+  would, including near the poles and across the antimeridian.
+- refresh() must index the next picture the same way a fresh build does, whether it
+  re-buckets the moved tracks or rebuilds the grid.
+
+Usage:
+    python -m pytest dbc_app/test_spatial_index.py
+"""
+
+import numpy as np
+import pandas as pd
+
+import geo
+from spatial_index import SpatialIndex
+
+QUERIES = [(0.0, 0.0), (25.0, -78.0), (89.5, 10.0), (-88.0, -170.0), (10.0, 179.9), (-5.0, -179.5)]
+
+
+def _picture(seed, n=400):
+    rng = np.random.default_rng(seed)
+    lats = rng.uniform(-90, 90, n)
+    lats[::37] = np.nan
+    return pd.DataFrame({
+        "tracknumber": np.arange(n),
+        "latitude": lats,
+        "longitude": rng.uniform(-180, 180, n),
+        "trackid": rng.choice(["Hostile", "Friend"], n),
+    })
+
+
+def _brute_distances(df, lat, lon):
+    return geo.haversine_np(lat, lon, df["latitude"].to_numpy(), df["longitude"].to_numpy())
+
+
+def test_within_radius_matches_brute_force():
+    df = _picture(1)
+    index = SpatialIndex.from_frame(df)
+    for lat, lon in QUERIES:
+        dist = _brute_distances(df, lat, lon)
+        for km in (50.0, 900.0, 4000.0, 25000.0):
+            hits = index.within_radius(lat, lon, km)
+            assert [h.position for h in hits] == list(np.flatnonzero(dist < km))
+
+
+def test_k_nearest_matches_brute_force():
+    df = _picture(2)
+    index = SpatialIndex.from_frame(df)
+    hostile = df["trackid"].to_numpy() == "Hostile"
+    for lat, lon in QUERIES:
+        dist = _brute_distances(df, lat, lon)
+        nearest = [p for p in np.lexsort((np.arange(len(df)), dist)) if not np.isnan(dist[p])]
+        for k in (1, 5, 40):
+            assert [h.position for h in index.k_nearest(lat, lon, k)] == nearest[:k]
+            assert ([h.position for h in index.k_nearest(lat, lon, k, {"trackid": "Hostile"})]
+                    == [p for p in nearest if hostile[p]][:k])
+
+
+def test_refresh_matches_a_fresh_build():
+    df = _picture(3)
+    index = SpatialIndex.from_frame(df)
+    rng = np.random.default_rng(4)
+    for moved in (3, 200):
+        nxt = df.copy()
+        rows = rng.choice(len(df), moved, replace=False)
+        nxt.loc[rows, "latitude"] = rng.uniform(-90, 90, moved)
+        refreshed, rebuilt = index.refresh(nxt), SpatialIndex.from_frame(nxt)
+
+        assert refreshed._cells.keys() == rebuilt._cells.keys()
+        for cell, members in rebuilt._cells.items():
+            np.testing.assert_array_equal(refreshed._cells[cell], members)
+        for lat, lon in QUERIES:
+            assert ([h.position for h in refreshed.k_nearest(lat, lon, 10)]
+                    == [h.position for h in rebuilt.k_nearest(lat, lon, 10)])
@@ -0,0 +1,47 @@
+"""
+test_track_parser.py
+---------
+Tests for the shared MEF entity string parser.
+
+Purpose:
+- Pin the fields every module reads from an entity string, including the older
+  "Lattitude" spelling, "None" values and commas inside a value.
+
+Usage:
+    python -m pytest dbc_app/test_track_parser.py
+"""
+
+import track_parser
+
+ENTITY = "44875 (CallSign: None, Track Cat: Air, Track ID: Hostile, Aircraft Type: None, Lattitude: 23.94, Longitude: -78.38)"
+
+
+def test_parse_target_fields():
+    target = track_parser.parse_target(ENTITY)
+
+    assert target.track_id == "44875"
+    assert target.callsign is None
+    assert target.track_cat == "Air"
+    assert target.track_id_label == "Hostile"
+    assert target.aircraft_type is None
+    assert (target.latitude, target.longitude) == (23.94, -78.38)
+    assert target.get("Track ID") == "Hostile"
+    assert target.info()["ID"] == "44875"
+
+
+def test_parse_target_keeps_commas_inside_values():
+    target = track_parser.parse_target("255 (CallSign: HARPY, 02, Track Cat: Air, Latitude: 1.5, Longitude: x)")
+
+    assert target.callsign == "HARPY, 02"
+    assert target.track_cat == "Air"
+    assert target.latitude == 1.5
+    assert target.longitude is None
+
+
+def test_parse_target_rejects_other_input_and_reuses_records():
+    assert track_parser.parse_target("not an entity") is None
+    assert track_parser.parse_target(None) is None
+
+    target = track_parser.parse_target(ENTITY)
+    assert track_parser.parse_target(ENTITY) is target
+    assert track_parser.parse_target(target) is target
@@ -0,0 +1,40 @@
+"""
+test_user_input.py
+---------
+Tests for the user_input request key used to skip already answered requests.
+
+Purpose:
+- Keep the key stable across the user_input and MEF tables, so an answered request is
+  not inserted again every cycle when the two timestamp columns differ in type.
+
+Usage:
+    python -m pytest dbc_app/test_user_input.py
+"""
+
+import datetime as dt
+
+import pandas as pd
+
+import user_input
+
+
+def test_request_key_matches_aware_and_naive_timestamps():
+    eastern = dt.timezone(dt.timedelta(hours=-5))
+    aware = dt.datetime(2025, 1, 2, 3, 4, 5, 123456, tzinfo=eastern)
+    naive_utc = dt.datetime(2025, 1, 2, 8, 4, 5, 123456)
+
+    assert user_input.request_key("255", 44875, aware) == user_input.request_key(255.0, " 44875", naive_utc)
+
+
+def test_request_key_ignores_sub_microsecond_precision():
+    nanos = pd.Timestamp("2025-01-02 08:04:05.123456789")
+    micros = "2025-01-02T08:04:05.123456+00:00"
+
+    assert user_input.request_key(255, 44875, nanos) == user_input.request_key(255, 44875, micros)
+
+
+def test_request_key_keeps_distinct_requests_apart():
+    first = dt.datetime(2025, 1, 2, 8, 4, 5)
+
+    assert user_input.request_key(255, 44875, first) != user_input.request_key(255, 44875, first + dt.timedelta(seconds=1))
+    assert user_input.request_key(255, 44875, first) != user_input.request_key(256, 44875, first)
@@ -7,12 +7,17 @@ import pandas as pd
 
 # groundspeed = meters / second
 
+GROUNDSPEED_COLUMNS = ("groundspeed",)
 
-def compute_time(friendly, target):
+
+def compute_time(friendly, target, snapshot=None):
     """calculate time to target"""
 
     distance = float(friendly["distance_km"]) * 1000  # convert to meters
-    groundspeed_data = database.get_groundspeed(friendly["merged_tracknumber"])
+    if snapshot is not None:
+        groundspeed_data = snapshot.track_by_number(friendly["merged_tracknumber"])
+    else:
+        groundspeed_data = database.get_groundspeed(friendly["merged_tracknumber"], columns=GROUNDSPEED_COLUMNS)
 
     groundspeed = groundspeed_data["groundspeed"]
     if isinstance(groundspeed, pd.Series):
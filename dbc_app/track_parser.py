@@ -0,0 +1,129 @@
+"""
+track_parser.py
+---------
+One parser for the MEF entity string shared by every module.
+
+Purpose:
+- Parse "44875 (CallSign: None, Track Cat: Air, Track ID: Hostile, Aircraft Type: None,
+  Latitude: 23.94, Longitude: -78.38)" into an immutable TargetTrack with the position
+  already converted to floats.
+- Memoize by string so a target that fuel, support, hostiles, armament, fiveline and app
+  all look at in one cycle is only parsed once.
+
+The record is frozen and shared between callers: never mutate it, use `info()` for a
+plain dict copy of the key/value pairs.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, Optional, Tuple
+
+PARSE_CACHE_SIZE = int(os.getenv("TRACK_PARSE_CACHE_SIZE", "1024"))
+
+_TRACK_RE = re.compile(r"\s*(\d+)\s*\((.*)\)")
+
+# Normalized key -> TargetTrack field; "Lattitude" shows up in older MEF rows
+_FIELDS = {
+    "callsign": "callsign",
+    "trackcat": "track_cat",
+    "trackid": "track_id_label",
+    "aircrafttype": "aircraft_type",
+    "latitude": "latitude",
+    "lattitude": "latitude",
+    "longitude": "longitude",
+}
+
+
+@dataclass(frozen=True)
+class TargetTrack:
+    track_id: str                       # leading track number, e.g. "44875"
+    callsign: Optional[str]
+    track_cat: Optional[str]            # Air / Land / Surface ...
+    track_id_label: Optional[str]       # Hostile / Friend / ...
+    aircraft_type: Optional[str]
+    latitude: Optional[float]
+    longitude: Optional[float]
+    raw: Tuple[Tuple[str, str], ...]    # every "Key: value" pair, in order
+
+    def get(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        """Raw string value of a key as written in the entity string."""
+        for k, v in self.raw:
+            if k == key:
+                return v
+        return default
+
+    def info(self) -> Dict[str, str]:
+        """The dict the old per-module parse_track_info helpers returned ("ID" included)."""
+        info_dict = dict(self.raw)
+        info_dict["ID"] = self.track_id
+        return info_dict
+
+
+def _norm_key(key: str) -> str:
+    return re.sub(r"[\s_]+", "", key).lower()
+
+
+def _text(value: Optional[str]) -> Optional[str]:
+    """'None' and empty values mean absent."""
+    if value is None or value == "" or value.lower() == "none":
+        return None
+    return value
+
+
+def _number(value: Optional[str]) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _pairs(key_values: str) -> Tuple[Tuple[str, str], ...]:
+    pairs = []
+    for kv in key_values.split(","):
+        if ":" in kv:
+            key, value = kv.split(":", 1)
+            pairs.append([key.strip(), value.strip()])
+        elif pairs:
+            # A comma inside a value (e.g. a callsign) - keep it with the previous pair
+            pairs[-1][1] = f"{pairs[-1][1]},{kv}".strip()
+    return tuple((k, v) for k, v in pairs)
+
+
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def _parse(text: str) -> Optional[TargetTrack]:
+    match = _TRACK_RE.match(text)
+    if not match:
+        return None
+
+    raw = _pairs(match.group(2))
+    values: Dict[str, Optional[str]] = {}
+    for key, value in raw:
+        field_name = _FIELDS.get(_norm_key(key))
+        if field_name and field_name not in values:
+            values[field_name] = value
+
+    return TargetTrack(
+        track_id=match.group(1),
+        callsign=_text(values.get("callsign")),
+        track_cat=_text(values.get("track_cat")),
+        track_id_label=_text(values.get("track_id_label")),
+        aircraft_type=_text(values.get("aircraft_type")),
+        latitude=_number(values.get("latitude")),
+        longitude=_number(values.get("longitude")),
+        raw=raw,
+    )
+
+
+def parse_target(text) -> Optional[TargetTrack]:
+    """TargetTrack for an MEF entity string, or None when it is not in "<tn> (...)" form."""
+    if isinstance(text, TargetTrack):
+        return text
+    if not isinstance(text, str):
+        return None
+    return _parse(text)
+
+
+def cache_info():
+    return _parse.cache_info()
@@ -1,83 +1,127 @@
 import database
-import math
+import geo
 import json
-import re
-
-def insert_input():
-    # Load data
-    user_input = database.query_user_input()
-    bc3_all = database.query_bc3_with_all_vw()
-    bc3_friends = database.query_bc3_friends_vw()
-    mef = database.query_all_mef()
+import os
+import pandas as pd
+import track_parser
+from snapshot import first_row_index
+
+# Time zone of naive timestamps read back from the database (its session TimeZone)
+NAIVE_TZ = os.getenv("DBC_NAIVE_TZ", "UTC")
+
+# bc3_with_all_vw columns used for targets and for assets missing from bc3_friends_vw
+TRACK_COLUMNS = ("tracknumber", "trackid", "trackcategory", "callsign", "aircraft_type",
+                 "latitude", "longitude", "weapon", "bc3_jtn")
+
+def _norm_tn(value):
+    """255, 255.0 and ' 255' all become '255'."""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+def _norm_time(value):
+    """
+    UTC timestamp at microsecond (Postgres) precision, so a user_input timestamp and its
+    copy in the MEF table compare equal whether either column is tz-aware or naive.
+    Naive values are read as NAIVE_TZ, the database session time zone.
+    """
+    try:
+        stamp = pd.Timestamp(value)
+    except (TypeError, ValueError):
+        return str(value)
+    if pd.isna(stamp):
+        return None
+    if stamp.tzinfo is None:
+        stamp = stamp.tz_localize(NAIVE_TZ)
+    return stamp.tz_convert("UTC").floor("us")
+
+
+def request_key(asset_tn, target_tn, timestamp):
+    """
+    Identity of one user request: the same asset/target pairing asked for again later is a
+    new request, the same user_input row read on the next cycle is not.
+    """
+    return _norm_tn(asset_tn), _norm_tn(target_tn), _norm_time(timestamp)
+
+
+class MefIndex:
+    """
+    request_key() of every row in the MEF table, kept in process.
+    Seeded with one full read, then only rows at or after the newest timestamp seen are
+    fetched, so the per-cycle cost does not grow with the table.
+    """
+
+    def __init__(self):
+        self.keys = set()
+        self.last_seen = None
+
+    def refresh(self):
+        rows = database.query_mef_since(self.last_seen)
+        for row in rows.itertuples(index=False):
+            target_mef = track_parser.parse_target(row.entity)
+            if target_mef is None:
+                # print(f"Skipping invalid MEF row: {row.entity}")
+                continue
+            asset_mef = json.loads(row.actions) if isinstance(row.actions, str) else row.actions
+            if not asset_mef or "merged_tracknumber" not in asset_mef[0]:
+                continue
+            self.keys.add(request_key(asset_mef[0]["merged_tracknumber"], target_mef.track_id, row.timestamp))
+        if not rows.empty and "timestamp" in rows.columns:
+            newest = rows["timestamp"].max()
+            if pd.notna(newest):
+                self.last_seen = newest.to_pydatetime() if hasattr(newest, "to_pydatetime") else newest
+
+    def add(self, key):
+        self.keys.add(key)
+
+    def __contains__(self, key):
+        return key in self.keys
+
+
+mef_index = MefIndex()
+
+
+def insert_input(snapshot=None):
+    # Load data: every pending request in queue mode, the newest one otherwise
+    if database.QUEUE_MODE:
+        user_input = database.claim_user_input(database.BATCH_MAX_SIZE)
+    else:
+        user_input = database.query_user_input()
+    # Hash indexes for the asset/entity lookups, built once per load
+    if snapshot is not None:
+        friends_by_tn = snapshot.friends_by_merged_tracknumber
+        tracks_by_tn = snapshot.tracks_by_tracknumber
+    else:
+        friends_by_tn = first_row_index(database.query_bc3_friends_vw(), "merged_tracknumber")
+        tracks_by_tn = first_row_index(database.query_bc3_with_all_vw(columns=TRACK_COLUMNS), "tracknumber")
+    mef_index.refresh()
     print(user_input)
 
-    def haversine(lat1, lon1, lat2, lon2):
-        """Calculate the great-circle distance between two points on Earth in km."""
-        R = 6371
-        phi1 = math.radians(lat1)
-        phi2 = math.radians(lat2)
-        delta_phi = math.radians(lat2 - lat1)
-        delta_lambda = math.radians(lon2 - lon1)
-        a = math.sin(delta_phi / 2)**2 + math.cos(phi1) * math.cos(phi2) * math.sin(delta_lambda / 2)**2
-        c = 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
-        return R * c
-
-    def parse_track_info(track_string):
-        """Parse MEF entity string into a dictionary with ID."""
-        match = re.match(r"(\d+)\s*\((.*)\)", track_string)
-        if not match:
-            return None
-        track_id = match.group(1)
-        key_values = match.group(2)
-        info_dict = {}
-        for kv in key_values.split(","):
-            key, value = kv.split(":", 1)
-            info_dict[key.strip()] = value.strip()
-        info_dict["ID"] = track_id
-        return info_dict
-
-    # Build existing pairs from MEF table (normalize to strings)
-    existing_pairs = set()
-    for row in mef.itertuples(index=False):
-        target_mef = parse_track_info(row.entity)
-        if target_mef is None or "ID" not in target_mef:
-            # print(f"Skipping invalid MEF row: {row.entity}")
-            continue
-        asset_mef = row.actions
-        if not asset_mef or "merged_tracknumber" not in asset_mef[0]:
-            continue
-        existing_pairs.add((
-            str(asset_mef[0]["merged_tracknumber"]).strip(),
-            str(target_mef["ID"]).strip()
-        ))
-
-    # Track duplicates in the current batch
-    
-    # print(existing_pairs)
+    # MEF rows of this batch, written together after the loop
+    pending_rows, pending_keys, pending_labels = [], [], []
+
     # Process user_input
     for a in user_input.itertuples(index=False):
         pair_key = (str(a.asset_tn).strip(), str(a.target_tn).strip())
+        key = request_key(a.asset_tn, a.target_tn, a.timestamp)
+        if key in mef_index or key in pending_keys:
+            # Already turned into an MEF row on an earlier cycle, or earlier in this batch
+            continue
         # Find asset and entity
         print("***")
-        asset = next((row for row in bc3_friends.itertuples(index=False)
-                    if a.asset_tn == row.merged_tracknumber), None)
-                    
-        entity_row = next((row for row in bc3_all.itertuples(index=False)
-                        if a.target_tn == row.tracknumber), None)
+        asset = friends_by_tn.get(a.asset_tn)
+        entity_row = tracks_by_tn.get(a.target_tn)
        
         if entity_row == None:
             print("Non existent entity match" )
             continue
 
-      
-
         # Proceed with insertion
-        asset = next((row for row in bc3_friends.itertuples(index=False) if a.asset_tn == row.merged_tracknumber), None)
-        entity_row = next((row for row in bc3_all.itertuples(index=False) if a.target_tn == row.tracknumber), None)
         flag = False
 
         if asset is None:
-            asset = next((row for row in bc3_all.itertuples(index=False) if a.asset_tn == row.tracknumber), None)
+            asset = tracks_by_tn.get(a.asset_tn)
             if asset is None:
                 print(f"Non-existent match for Asset {a.asset_tn}")
                 continue
@@ -91,7 +135,7 @@ def insert_input():
         print(pair_key)
 
         # Compute distance
-        distance = haversine(asset.latitude, asset.longitude, entity_row.latitude, entity_row.longitude)
+        distance = geo.haversine(asset.latitude, asset.longitude, entity_row.latitude, entity_row.longitude)
 
         # Build action dictionary
         if flag:
@@ -136,15 +180,18 @@ def insert_input():
 
         timestamp = a.timestamp
 
-        # Insert into database
+        asset_label = asset.tracknumber if flag else asset.merged_tracknumber
+
+        # Queue for insertion
         try:
-            database.insert_data(entity, json.dumps(action), "text", timestamp)
-            if flag:
-                print(f"Inserted: Asset {asset.tracknumber}, Target {a.target_tn}")
-            else:
-                print(f"Inserted: Asset {asset.merged_tracknumber}, Target {a.target_tn}")
+            pending_rows.append((entity, json.dumps(action), "text", timestamp))
+            pending_keys.append(key)
+            pending_labels.append((asset_label, a.target_tn))
         except Exception as e:
-            if flag:
-                print(f"Error inserting data for Asset {asset.tracknumber}, Target {a.target_tn}: {e}")
-            else:
-                print(f"Error inserting data for Asset {asset.merged_tracknumber}, Target {a.target_tn}: {e}")
+            print(f"Error inserting data for Asset {asset_label}, Target {a.target_tn}: {e}")
+
+    # Insert into database: the whole batch in one transaction
+    if pending_rows and database.insert_data_many(pending_rows):
+        for key, (asset_label, target_tn) in zip(pending_keys, pending_labels):
+            mef_index.add(key)
+            print(f"Inserted: Asset {asset_label}, Target {target_tn}")